@@ -0,0 +1,105 @@
+import os
+
+from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html, format_html_join
+
+from recipes.paginators import EstimatedCountPaginator
+from .models import RequestProfile
+from .profiling import PARAM, make_token, profile_path
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = (
+        'created',
+        'method',
+        'path',
+        'status',
+        'duration',
+        'query_count',
+        'query_time',
+        'user'
+    )
+    list_filter = ('method', 'status')
+    list_select_related = ('user',)
+    search_fields = ('path',)
+    fields = (
+        'created',
+        'user',
+        'method',
+        'path',
+        'status',
+        'duration',
+        'query_count',
+        'query_time',
+        'download',
+        'stats_text',
+        'sql_trace'
+    )
+    readonly_fields = fields
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        self.message_user(request, (
+            f'Токен профилирования на час: {make_token(request.user)}. '
+            f'Передайте его в заголовке X-Profile или параметре ?{PARAM}=.'
+        ))
+        return super().changelist_view(request, extra_context)
+
+    def get_urls(self):
+        return [
+            path(
+                '<int:pk>/download/',
+                self.admin_site.admin_view(self.download_view),
+                name='api_requestprofile_download'
+            ),
+        ] + super().get_urls()
+
+    def download_view(self, request, pk):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        if not os.path.exists(profile_path(profile.file)):
+            raise Http404('Файл профиля удалён.')
+        return FileResponse(
+            open(profile_path(profile.file), 'rb'),
+            as_attachment=True,
+            filename=profile.file
+        )
+
+    @admin.display(description='Файл pstats')
+    def download(self, obj):
+        return format_html(
+            '<a href="{}">{}</a>',
+            reverse('admin:api_requestprofile_download', args=[obj.pk]),
+            obj.file
+        )
+
+    @admin.display(description='Функции по суммарному времени')
+    def stats_text(self, obj):
+        return format_html('<pre>{}</pre>', obj.stats)
+
+    @admin.display(description='SQL')
+    def sql_trace(self, obj):
+        return format_html(
+            '<pre>{}</pre>',
+            format_html_join(
+                '\n', '{} мс  {}  {}\n    {}',
+                (
+                    (query['ms'], query['site'], query['serializer'],
+                     query['sql'])
+                    for query in obj.queries
+                )
+            )
+        )
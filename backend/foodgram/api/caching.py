@@ -0,0 +1,131 @@
+import gzip
+import hashlib
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+from .singleflight import fetch
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+MIN_COMPRESS_LENGTH = 200
+
+
+def version_key(namespace):
+    return f'api:{namespace}:version'
+
+
+def get_version(namespace):
+    return cache.get_or_set(version_key(namespace), 1, None)
+
+
+def invalidate(*namespaces):
+    """Сбросить кэш ответов для перечисленных пространств имён."""
+    for namespace in namespaces:
+        try:
+            cache.incr(version_key(namespace))
+        except ValueError:
+            cache.set(version_key(namespace), 1, None)
+
+
+def compress_body(body, content_type):
+    """Сжать тело ответа один раз во все поддерживаемые кодировки."""
+    entry = {'content_type': content_type, 'identity': body}
+    if len(body) >= MIN_COMPRESS_LENGTH:
+        entry['gzip'] = gzip.compress(body)
+        if brotli is not None:
+            entry['br'] = brotli.compress(body)
+    return entry
+
+
+def accepted_encodings(request):
+    encodings = set()
+    header = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00'):
+            continue
+        encodings.add(coding.strip().lower())
+    return encodings
+
+
+def entry_response(entry, request):
+    """Ответ из кэша в лучшей кодировке, которую принимает клиент."""
+    encodings = accepted_encodings(request)
+    response = HttpResponse(content_type=entry['content_type'])
+    for coding in ('br', 'gzip'):
+        if coding in entry and coding in encodings:
+            response.content = entry[coding]
+            response['Content-Encoding'] = coding
+            break
+    else:
+        response.content = entry['identity']
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+class CachedResponseMixin:
+    """Кэширование готовых сжатых ответов для чтения.
+
+    Тело ответа рендерится и сжимается один раз, после чего
+    отдаётся из кэша до сброса версии пространства имён. Горячие
+    ключи обновляются заранее одним запросом, без лавины промахов.
+    """
+
+    cache_namespace = None
+    cache_timeout = 60 * 10
+    cache_anonymous_only = False
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def is_cacheable(self, request):
+        return (
+            self.cache_namespace is not None
+            and request.method == 'GET'
+            and request.accepted_renderer.format == 'json'
+            and not (
+                self.cache_anonymous_only
+                and request.user.is_authenticated
+            )
+        )
+
+    def get_cache_key(self, request):
+        query = urlencode(sorted(
+            (key, value)
+            for key, values in request.GET.lists() for value in values
+        ))
+        path = hashlib.md5(
+            f'{request.path}?{query}'.encode('utf-8')).hexdigest()
+        version = get_version(self.cache_namespace)
+        return f'api:{self.cache_namespace}:{version}:{path}'
+
+    def cached_response(self, request, handler, *args, **kwargs):
+        if not self.is_cacheable(request):
+            return handler(request, *args, **kwargs)
+        uncached = []
+
+        def render():
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                uncached.append(response)
+                return None
+            response.accepted_renderer = request.accepted_renderer
+            response.accepted_media_type = request.accepted_media_type
+            response.renderer_context = self.get_renderer_context()
+            response.render()
+            return compress_body(
+                response.rendered_content, response['Content-Type'])
+
+        # Одновременные промахи по ключу ждут один рендер.
+        entry = fetch(self.get_cache_key(request), render, self.cache_timeout)
+        if entry is None:
+            if uncached:
+                return uncached[0]
+            return handler(request, *args, **kwargs)
+        return entry_response(entry, request)
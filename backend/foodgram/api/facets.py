@@ -0,0 +1,90 @@
+from django.core.cache import cache
+from django.db.models import Count, F, Q, Sum
+from rest_framework.exceptions import ValidationError
+
+from recipes.models import Recipe, Tag, tag_bit
+from .caching import get_version
+from .sparse import split_names
+
+FACETS_PARAM = 'facets'
+FACETS = ('tags', 'cooking_time')
+# Границы корзин времени приготовления в минутах, None — без верхней.
+COOKING_TIME_BUCKETS = ((0, 15), (15, 30), (30, 60), (60, None))
+
+
+def requested_facets(request):
+    value = request.query_params.get(FACETS_PARAM)
+    if value is None:
+        return ()
+    names = split_names(value)
+    unknown = names.difference(FACETS)
+    if unknown:
+        raise ValidationError({
+            FACETS_PARAM: f"Неизвестные фасеты: {', '.join(sorted(unknown))}."
+        })
+    return tuple(name for name in FACETS if name in names)
+
+
+def facet_tags():
+    """Теги для подсчёта; кэш сбрасывается вместе с кэшем тегов."""
+    key = f"api:tags:{get_version('tags')}:facet-tags"
+    return cache.get_or_set(
+        key, lambda: list(Tag.objects.values_list('id', 'name', 'slug')),
+        None
+    )
+
+
+def cooking_time_filter(low, high):
+    condition = Q(cooking_time__gte=low)
+    if high is not None:
+        condition &= Q(cooking_time__lt=high)
+    return condition
+
+
+def facet_counts(queryset, facets):
+    """Число рецептов выборки по тегам и корзинам времени.
+
+    Всё считается одним агрегатом по выборке: тег с битом в
+    Recipe.tags_mask даёт сумму (mask & bit) / bit. Только для тегов
+    без бита нужен отдельный запрос по связующей таблице.
+    """
+    tags = facet_tags() if 'tags' in facets else []
+    aggregates = {}
+    for tag_id, _, _ in tags:
+        bit = tag_bit(tag_id)
+        if bit is not None:
+            aggregates[f'tag_{tag_id}'] = Sum(
+                F('tags_mask').bitand(bit) / bit)
+    if 'cooking_time' in facets:
+        for index, (low, high) in enumerate(COOKING_TIME_BUCKETS):
+            aggregates[f'time_{index}'] = Count(
+                'pk', filter=cooking_time_filter(low, high))
+    counts = queryset.aggregate(**aggregates) if aggregates else {}
+    unmasked = [
+        tag_id for tag_id, _, _ in tags if tag_bit(tag_id) is None]
+    if unmasked:
+        counts.update(
+            (f"tag_{row['tag_id']}", row['count'])
+            for row in Recipe.tags.through.objects
+            .filter(recipe__in=queryset.values('pk'), tag_id__in=unmasked)
+            .values('tag_id')
+            .annotate(count=Count('recipe_id', distinct=True))
+        )
+
+    result = {}
+    if 'tags' in facets:
+        result['tags'] = [
+            {
+                'id': tag_id,
+                'name': name,
+                'slug': slug,
+                'count': counts.get(f'tag_{tag_id}') or 0
+            }
+            for tag_id, name, slug in tags
+        ]
+    if 'cooking_time' in facets:
+        result['cooking_time'] = [
+            {'min': low, 'max': high, 'count': counts[f'time_{index}']}
+            for index, (low, high) in enumerate(COOKING_TIME_BUCKETS)
+        ]
+    return result
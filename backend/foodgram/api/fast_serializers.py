@@ -0,0 +1,82 @@
+from recipes.documents import (AUTHOR_VALUES, INGREDIENT_VALUES, TAG_VALUES,
+                               load_documents)
+from .loaders import ViewerStateLoader
+from .sparse import selected_fields
+
+RECIPE_FIELDS = (
+    'id',
+    'tags',
+    'author',
+    'ingredients',
+    'is_favorited',
+    'is_in_shopping_cart',
+    'name',
+    'image',
+    'text',
+    'cooking_time'
+)
+# Поля, которые берутся из документа рецепта.
+DOCUMENT_FIELDS = set(RECIPE_FIELDS) - {
+    'id', 'is_favorited', 'is_in_shopping_cart'}
+
+
+def render_field(name, document, request):
+    if name == 'tags':
+        return [dict(zip(TAG_VALUES, tag)) for tag in document['tags']]
+    if name == 'ingredients':
+        return [
+            dict(zip(INGREDIENT_VALUES, ingredient))
+            for ingredient in document['ingredients']
+        ]
+    if name == 'image':
+        image = document['image']
+        if image is not None and request is not None:
+            image = request.build_absolute_uri(image)
+        return image
+    return document[name]
+
+
+def serialize_recipes(recipe_ids, request):
+    """Представление рецептов, идентичное RecipeReadSerializer.
+
+    Общая для всех часть берётся из документов рецептов одним
+    запросом, сверху добавляются флаги текущего пользователя.
+    Поля, исключённые через ?fields= или ?omit=, не загружаются.
+    """
+    fields = selected_fields(request, RECIPE_FIELDS)
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return []
+    documents = {}
+    if DOCUMENT_FIELDS.intersection(fields):
+        documents = load_documents(recipe_ids)
+        recipe_ids = [pk for pk in recipe_ids if pk in documents]
+
+    viewer = ViewerStateLoader.for_request(request)
+    if 'author' in fields:
+        viewer.prime('subscribed', {
+            documents[pk]['author'][1] for pk in recipe_ids})
+    if 'is_favorited' in fields:
+        viewer.prime('favorited', recipe_ids)
+    if 'is_in_shopping_cart' in fields:
+        viewer.prime('in_cart', recipe_ids)
+
+    data = []
+    for recipe_id in recipe_ids:
+        document = documents.get(recipe_id)
+        item = {}
+        for name in fields:
+            if name == 'id':
+                item['id'] = recipe_id
+            elif name == 'author':
+                author = dict(zip(AUTHOR_VALUES, document['author']))
+                author['is_subscribed'] = viewer.is_subscribed(author['id'])
+                item['author'] = author
+            elif name == 'is_favorited':
+                item[name] = viewer.is_favorited(recipe_id)
+            elif name == 'is_in_shopping_cart':
+                item[name] = viewer.is_in_shopping_cart(recipe_id)
+            else:
+                item[name] = render_field(name, document, request)
+        data.append(item)
+    return data
@@ -1,6 +1,14 @@
+from django.db.models import F
 from django_filters.rest_framework import FilterSet, filters
 
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.models import Ingredient, Recipe, Tag, tag_bit, tags_mask
+from recipes.search import search_ingredients
+
+
+RECIPE_ORDERINGS = {
+    'popular': ('-popularity', '-pub_date'),
+    'trending': ('-trending', '-pub_date'),
+}
 
 
 class RecipeFilter(FilterSet):
@@ -9,17 +17,49 @@ class RecipeFilter(FilterSet):
     tags = filters.ModelMultipleChoiceFilter(
         field_name='tags__slug',
         to_field_name='slug',
-        queryset=Tag.objects.all()
+        queryset=Tag.objects.all(),
+        method='tags_filter'
     )
+    tags_match = filters.ChoiceFilter(
+        choices=[('any', 'any'), ('all', 'all')],
+        method='tags_match_filter')
     is_favorited = filters.BooleanFilter(
         method='is_favorited_filter')
     is_in_shopping_cart = filters.BooleanFilter(
         method='is_in_shopping_cart_filter')
+    ordering = filters.ChoiceFilter(
+        choices=[(key, key) for key in RECIPE_ORDERINGS],
+        method='ordering_filter')
 
     class Meta:
         model = Recipe
         fields = ['tags', 'author', ]
 
+    def tags_filter(self, queryset, name, tags):
+        """Отбор по тегам одним условием на Recipe.tags_mask.
+
+        По умолчанию рецепт должен иметь любой из тегов, при
+        tags_match=all — все. Теги без своего бита в маске
+        отбираются через связующую таблицу.
+        """
+        if not tags:
+            return queryset
+        match_all = self.data.get('tags_match') == 'all'
+        if any(tag_bit(tag.pk) is None for tag in tags):
+            if match_all:
+                for tag in tags:
+                    queryset = queryset.filter(tags=tag)
+                return queryset
+            return queryset.filter(tags__in=tags).distinct()
+        mask = tags_mask(tag.pk for tag in tags)
+        queryset = queryset.alias(tag_hits=F('tags_mask').bitand(mask))
+        if match_all:
+            return queryset.filter(tag_hits=mask)
+        return queryset.exclude(tag_hits=0)
+
+    def tags_match_filter(self, queryset, name, value):
+        return queryset
+
     def is_favorited_filter(self, queryset, name, value):
         user = self.request.user
         if value and user.is_authenticated:
@@ -32,12 +72,22 @@ class RecipeFilter(FilterSet):
             return queryset.filter(shopping_recipe__user=user)
         return queryset
 
+    def ordering_filter(self, queryset, name, value):
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
+
 
 class IngredientFilter(FilterSet):
-    """Фильтр для выбора ингредиентов из базы."""
+    """Фильтр для выбора ингредиентов из базы.
 
-    name = filters.CharFilter(lookup_expr='istartswith')
+    Сначала совпадения по началу названия, затем по началу слова,
+    затем похожие названия с опечатками.
+    """
+
+    name = filters.CharFilter(method='name_filter')
 
     class Meta:
         model = Ingredient
         fields = ['name']
+
+    def name_filter(self, queryset, name, value):
+        return search_ingredients(queryset, value)
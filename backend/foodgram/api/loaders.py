@@ -0,0 +1,79 @@
+from rest_framework import serializers
+
+from recipes.models import Favorite, Shopping_cart
+from users.models import Subscribe
+
+# Флаг -> (модель, поле с id объекта, для которого считается флаг).
+VIEWER_FLAGS = {
+    'subscribed': (Subscribe, 'author_id'),
+    'favorited': (Favorite, 'recipe_id'),
+    'in_cart': (Shopping_cart, 'recipe_id'),
+}
+
+
+class ViewerStateLoader:
+    """Флаги текущего пользователя, загружаемые пачками на один запрос.
+
+    Сериализаторы сначала сообщают id объектов страницы через prime(),
+    после чего каждый флаг отвечается из памяти. Для незнакомого id
+    выполняется догрузка только этого id.
+    """
+
+    def __init__(self, user):
+        self.user = user if user and user.is_authenticated else None
+        self.known = {flag: set() for flag in VIEWER_FLAGS}
+        self.present = {flag: set() for flag in VIEWER_FLAGS}
+
+    @classmethod
+    def for_request(cls, request):
+        if request is None:
+            return cls(None)
+        loader = getattr(request, 'viewer_state', None)
+        if loader is None:
+            loader = cls(getattr(request, 'user', None))
+            request.viewer_state = loader
+        return loader
+
+    def prime(self, flag, ids):
+        if self.user is None:
+            return
+        missing = set(ids) - self.known[flag]
+        if not missing:
+            return
+        model, field = VIEWER_FLAGS[flag]
+        self.present[flag].update(
+            model.objects.filter(user=self.user, **{f'{field}__in': missing})
+            .values_list(field, flat=True)
+        )
+        self.known[flag].update(missing)
+
+    def get(self, flag, pk):
+        if self.user is None:
+            return False
+        self.prime(flag, (pk,))
+        return pk in self.present[flag]
+
+    def is_subscribed(self, author_id):
+        if self.user is not None and author_id == self.user.pk:
+            # На самого себя подписаться нельзя, запрос не нужен.
+            return False
+        return self.get('subscribed', author_id)
+
+    def is_favorited(self, recipe_id):
+        return self.get('favorited', recipe_id)
+
+    def is_in_shopping_cart(self, recipe_id):
+        return self.get('in_cart', recipe_id)
+
+
+def viewer_state(context):
+    return ViewerStateLoader.for_request(context.get('request'))
+
+
+class ViewerStateListSerializer(serializers.ListSerializer):
+    """Список, заранее загружающий флаги пользователя для всей страницы."""
+
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, 'all') else data)
+        self.child.prime_viewer_state(viewer_state(self.context), items)
+        return super().to_representation(items)
@@ -0,0 +1,63 @@
+import time
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import RequestFactory
+
+from foodgram.db.lifecycle import stats
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+    return values[index]
+
+
+class Command(BaseCommand):
+    help = ("Compare request latency with a new database connection per "
+            "request and with persistent connections")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--path', default='/api/users/')
+        parser.add_argument('--max-age', type=int, default=60,
+                            help="CONN_MAX_AGE for the persistent run")
+
+    def handle(self, *args, **options):
+        # Полный цикл WSGI: в отличие от тестового клиента, он
+        # закрывает соединения по сигналам начала и конца запроса.
+        handler = WSGIHandler()
+        factory = RequestFactory()
+        connection = connections['default']
+        original = connection.settings_dict['CONN_MAX_AGE']
+        runs = (('per request', 0), ('persistent', options['max_age']))
+        try:
+            for label, max_age in runs:
+                connection.settings_dict['CONN_MAX_AGE'] = max_age
+                connection.close()
+                self.request(handler, factory, options['path'])
+                stats.reset()
+                timings = [
+                    self.request(handler, factory, options['path'])
+                    for _ in range(options['requests'])
+                ]
+                snapshot = stats.snapshot()
+                self.stdout.write(
+                    f"{label:>12}: "
+                    f"mean {sum(timings) / len(timings) * 1000:.2f} ms, "
+                    f"p50 {percentile(timings, 50) * 1000:.2f} ms, "
+                    f"p95 {percentile(timings, 95) * 1000:.2f} ms, "
+                    f"{snapshot['connects']} connects "
+                    f"({snapshot['avg_connect_ms']:.2f} ms avg)"
+                )
+        finally:
+            connection.settings_dict['CONN_MAX_AGE'] = original
+            connection.close()
+
+    def request(self, handler, factory, path):
+        environ = factory.get(path).environ
+        started = time.perf_counter()
+        response = handler(environ, lambda status, headers: None)
+        response.close()
+        return time.perf_counter() - started
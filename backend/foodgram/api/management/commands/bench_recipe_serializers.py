@@ -0,0 +1,118 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from api.fast_serializers import serialize_recipes
+from api.serializers import RecipeReadSerializer
+from api.sparse import selected_fields
+from recipes.models import Recipe, RecipeDocument
+from users.models import User
+from .check_query_budgets import Rollback, create_data
+
+# Строки запроса, с которыми сверяются ответы: полный, ?fields=, ?omit=.
+QUERIES = (
+    '',
+    '?fields=id,name,author,is_favorited',
+    '?omit=ingredients,text,is_in_shopping_cart',
+)
+
+
+def make_request(query, viewer):
+    request = Request(RequestFactory().get(f'/api/recipes/{query}'))
+    if viewer is not None:
+        request.user = viewer
+    return request
+
+
+def slow(recipe_ids, request):
+    data = RecipeReadSerializer(
+        Recipe.objects.filter(pk__in=recipe_ids)
+        .prefetch_related('tags', 'recipes__ingredient')
+        .select_related('author'),
+        many=True, context={'request': request}).data
+    fields = selected_fields(request, RecipeReadSerializer.Meta.fields)
+    return [{name: item[name] for name in fields} for item in data]
+
+
+def mismatches(recipe_ids, viewer):
+    """Строки запроса, при которых быстрый путь расходится с DRF."""
+    renderer = JSONRenderer()
+    failed = []
+    for query in QUERIES:
+        expected = slow(recipe_ids, make_request(query, viewer))
+        actual = serialize_recipes(recipe_ids, make_request(query, viewer))
+        if renderer.render(expected) != renderer.render(actual):
+            failed.append(query or '(all fields)')
+    return failed
+
+
+class Command(BaseCommand):
+    help = ("Compare RecipeReadSerializer with the fast path: parity and "
+            "CPU. With --check, verify parity on generated data for an "
+            "anonymous and an authenticated viewer and exit non-zero on "
+            "any mismatch")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--user', help="email of the viewer")
+        parser.add_argument('--check', action='store_true',
+                            help="only check parity on generated data")
+
+    def handle(self, *args, **options):
+        if options['check']:
+            return self.check()
+        viewer = None
+        if options['user']:
+            viewer = User.objects.get(email=options['user'])
+        recipe_ids = list(
+            Recipe.objects.values_list('pk', flat=True)[:options['limit']])
+        count = len(recipe_ids)
+        if not count:
+            raise CommandError("No recipes to benchmark.")
+        failed = mismatches(recipe_ids, viewer)
+        if failed:
+            raise CommandError(
+                f"Fast path output differs from serializer: "
+                f"{', '.join(failed)}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Parity OK for {count} recipes."))
+
+        for name, func in (('serializer', slow),
+                           ('fast path', serialize_recipes)):
+            started = time.process_time()
+            for _ in range(options['repeat']):
+                func(recipe_ids, make_request('', viewer))
+            spent = time.process_time() - started
+            per_recipe = spent / (options['repeat'] * count) * 1e6
+            self.stdout.write(f"{name}: {per_recipe:.1f} us CPU per recipe")
+
+    def check(self):
+        failed = []
+        try:
+            with transaction.atomic():
+                data = create_data()
+                recipe_ids = list(
+                    Recipe.objects.filter(name__startswith='budget ')
+                    .values_list('pk', flat=True))
+                # Рецепт без документа: быстрый путь собирает его сам.
+                RecipeDocument.objects.filter(
+                    recipe_id=data['other']).delete()
+                viewers = (None, User.objects.get(pk=data['viewer']))
+                for viewer in viewers:
+                    label = 'authenticated' if viewer else 'anonymous'
+                    failed.extend(
+                        f"{label} {query}"
+                        for query in mismatches(recipe_ids, viewer))
+                raise Rollback
+        except Rollback:
+            pass
+        if failed:
+            raise CommandError(
+                f"Fast path output differs from serializer: "
+                f"{', '.join(failed)}")
+        self.stdout.write(self.style.SUCCESS("Serializer parity OK."))
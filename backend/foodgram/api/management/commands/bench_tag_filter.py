@@ -0,0 +1,72 @@
+import time
+from itertools import combinations
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F
+
+from recipes.models import Recipe, Tag, tags_mask
+
+
+def join_any(tags):
+    return Recipe.objects.filter(tags__in=tags).distinct()
+
+
+def join_all(tags):
+    return (
+        Recipe.objects.filter(tags__in=tags)
+        .annotate(tag_hits=Count('tags', distinct=True))
+        .filter(tag_hits=len(tags))
+    )
+
+
+def mask_any(tags):
+    return (
+        Recipe.objects
+        .alias(tag_hits=F('tags_mask').bitand(tags_mask(t.pk for t in tags)))
+        .exclude(tag_hits=0)
+    )
+
+
+def mask_all(tags):
+    mask = tags_mask(t.pk for t in tags)
+    return (
+        Recipe.objects
+        .alias(tag_hits=F('tags_mask').bitand(mask))
+        .filter(tag_hits=mask)
+    )
+
+
+class Command(BaseCommand):
+    help = "Compare tag filtering through the M2M join and Recipe.tags_mask"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--page-size', type=int, default=6)
+
+    def run(self, queryset, options):
+        started = time.perf_counter()
+        for _ in range(options['repeat']):
+            queryset.count()
+            list(queryset.order_by('-pub_date').values_list(
+                'pk', flat=True)[:options['page_size']])
+        return (time.perf_counter() - started) / options['repeat'] * 1000
+
+    def handle(self, *args, **options):
+        tags = list(Tag.objects.order_by('pk'))
+        if not tags:
+            raise CommandError("No tags to benchmark.")
+        for size in range(1, min(len(tags), 3) + 1):
+            selected = list(combinations(tags, size))[0]
+            slugs = ','.join(tag.slug for tag in selected)
+            for mode, join, mask in (('any', join_any, mask_any),
+                                     ('all', join_all, mask_all)):
+                join_ids = set(join(selected).values_list('pk', flat=True))
+                mask_ids = set(mask(selected).values_list('pk', flat=True))
+                if join_ids != mask_ids:
+                    raise CommandError(
+                        f"Mismatch for {mode} of {slugs}: "
+                        "run rebuild_tag_masks.")
+                self.stdout.write(
+                    f"{mode} [{slugs}]: {len(join_ids)} recipes, "
+                    f"join {self.run(join(selected), options):.2f} ms, "
+                    f"mask {self.run(mask(selected), options):.2f} ms")
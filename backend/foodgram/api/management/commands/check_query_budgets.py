@@ -0,0 +1,147 @@
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client
+from django.urls import resolve
+from rest_framework.authtoken.models import Token
+
+from api.queries import QueryInspector, view_budget
+from recipes.changes import publish
+from recipes.documents import rebuild_documents
+from recipes.models import (Favorite, Ingredient, Recipe, Recipe_is_ingredient,
+                            Shopping_cart, Tag)
+from users.models import Subscribe, User
+
+AUTHORS = 6
+RECIPES_PER_AUTHOR = 4
+# (метод, адрес, от имени читателя). {recipe} и {author} - рецепт и
+# автор из тестовых данных, {other} - рецепт не в избранном и не в корзине.
+PROBES = (
+    ('get', '/api/recipes/', False),
+    ('get', '/api/recipes/', True),
+    ('get', '/api/recipes/?is_favorited=1', True),
+    ('get', '/api/recipes/?tags=budget-0&tags=budget-1', False),
+    ('get', '/api/recipes/?facets=tags,cooking_time&tags=budget-1', False),
+    ('get', '/api/recipes/?ids={ids}', False),
+    ('get', '/api/recipes/?ids={ids}', True),
+    ('get', '/api/recipes/?fields=id,name,image,cooking_time', True),
+    ('get', '/api/recipes/{recipe}/', True),
+    ('get', '/api/recipes/{recipe}/similar/', True),
+    ('get', '/api/recipes/download_shopping_cart/', True),
+    ('post', '/api/recipes/{other}/favorite/', True),
+    ('post', '/api/recipes/{other}/shopping_cart/', True),
+    ('delete', '/api/recipes/{recipe}/favorite/', True),
+    ('get', '/api/users/', True),
+    ('get', '/api/users/{author}/', True),
+    ('get', '/api/users/me/', True),
+    ('get', '/api/users/subscriptions/', True),
+    ('get', '/api/users/subscriptions/?recipes_limit=2', True),
+    ('get', '/api/users/subscriptions/?omit=recipes,recipes_count', True),
+    ('get', '/api/tags/', False),
+    ('get', '/api/ingredients/?name=budget', False),
+    ('get', '/api/changes/?since=0', True),
+)
+
+
+class Rollback(Exception):
+    pass
+
+
+def create_data():
+    """Тестовые данные; вызывать внутри откатываемой транзакции."""
+    tags = [
+        Tag.objects.create(
+            name=f'budget {i}', color=f'#00000{i}', slug=f'budget-{i}')
+        for i in range(3)
+    ]
+    ingredients = [
+        Ingredient.objects.create(
+            name=f'budget {i}', measurement_unit='г')
+        for i in range(5)
+    ]
+    viewer = User.objects.create_user(
+        email='budget-viewer@example.com', username='budget-viewer',
+        first_name='budget', last_name='viewer', password='budget')
+    recipes = []
+    for i in range(AUTHORS):
+        author = User.objects.create_user(
+            email=f'budget-{i}@example.com', username=f'budget-{i}',
+            first_name='budget', last_name=str(i), password='budget')
+        Subscribe.objects.create(user=viewer, author=author)
+        for j in range(RECIPES_PER_AUTHOR):
+            recipe = Recipe.objects.create(
+                author=author, name=f'budget {i}-{j}',
+                text=f'budget {i}-{j}', cooking_time=j + 1,
+                image='recipes/budget.png')
+            # Теги привязываются не по порядку id: порядок в ответе
+            # не должен зависеть от порядка привязки.
+            for tag in reversed(tags[:j % len(tags) + 1]):
+                recipe.tags.add(tag)
+            Recipe_is_ingredient.objects.bulk_create([
+                Recipe_is_ingredient(
+                    recipe=recipe, ingredient=ingredient, amount=k + 1)
+                for k, ingredient in enumerate(ingredients[:3])
+            ])
+            recipes.append(recipe)
+    for recipe in recipes[::2]:
+        Favorite.objects.create(user=viewer, recipe=recipe)
+        Shopping_cart.objects.create(user=viewer, recipe=recipe)
+    # Внутри откатываемой транзакции on_commit не сработает.
+    rebuild_documents([recipe.pk for recipe in recipes])
+    publish()
+    token = Token.objects.create(user=viewer)
+    return {
+        'recipe': recipes[0].pk,
+        'author': recipes[0].author_id,
+        'other': recipes[1].pk,
+        'ids': ','.join(str(recipe.pk) for recipe in recipes[::-3]),
+        'token': token.key,
+        'viewer': viewer.pk,
+    }
+
+
+class Command(BaseCommand):
+    help = ("Run API endpoints against generated data and fail on N+1 "
+            "queries or query budget overruns")
+
+    def handle(self, *args, **options):
+        self.failures = []
+        try:
+            with transaction.atomic():
+                self.probe(create_data())
+                raise Rollback
+        except Rollback:
+            pass
+        if self.failures:
+            raise CommandError(
+                f"{len(self.failures)} endpoint(s) over query budget")
+        self.stdout.write(self.style.SUCCESS("Query budgets OK."))
+
+    def probe(self, data):
+        clients = {
+            False: Client(),
+            True: Client(HTTP_AUTHORIZATION=f"Token {data['token']}"),
+        }
+        for method, url, authenticated in PROBES:
+            url = url.format(**data)
+            for cache in caches.all():
+                cache.clear()
+            inspector = QueryInspector()
+            with inspector.watch():
+                response = getattr(clients[authenticated], method)(url)
+            action, budget = view_budget(
+                resolve(url.split('?')[0]).func, method)
+            problems = inspector.problems(budget)
+            label = (f"{method.upper()} {url}"
+                     f"{' (auth)' if authenticated else ''}")
+            if response.status_code >= 400:
+                problems.append(f'status {response.status_code}')
+            summary = (f"{label}: {len(inspector.queries)} queries, "
+                       f"budget {budget if budget is not None else '-'}")
+            if problems:
+                self.failures.append(label)
+                self.stdout.write(self.style.ERROR(summary))
+                for problem in problems:
+                    self.stdout.write(f"    {problem}")
+            else:
+                self.stdout.write(summary)
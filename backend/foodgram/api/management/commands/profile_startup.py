@@ -0,0 +1,111 @@
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Выполняется в чистом интерпретаторе, чтобы замерить холодный старт
+# воркера: импорт настроек, populate() реестра приложений и URLconf.
+PROBE = '''
+import json, os, sys, time
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+from django.apps.config import AppConfig
+timings = {}
+create = AppConfig.create.__func__
+import_models = AppConfig.import_models
+
+def timed_create(cls, entry):
+    started = time.perf_counter()
+    config = create(cls, entry)
+    timing = timings.setdefault(config.label, {})
+    timing['import'] = time.perf_counter() - started
+    ready = config.ready
+
+    def timed_ready():
+        started = time.perf_counter()
+        ready()
+        timing['ready'] = time.perf_counter() - started
+    config.ready = timed_ready
+    return config
+
+def timed_import_models(self):
+    started = time.perf_counter()
+    import_models(self)
+    timings[self.label]['models'] = time.perf_counter() - started
+
+AppConfig.create = classmethod(timed_create)
+AppConfig.import_models = timed_import_models
+started = time.perf_counter()
+import django
+django.setup()
+setup = time.perf_counter() - started
+started = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+urls = time.perf_counter() - started
+print(json.dumps({'apps': timings, 'setup': setup, 'urls': urls}))
+'''
+
+
+def parse_importtime(lines):
+    """Строки -X importtime -> {модуль: (собственное, суммарное) в с}."""
+    modules = {}
+    for line in lines:
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(own) / 1e6, int(cumulative) / 1e6)
+    return modules
+
+
+class Command(BaseCommand):
+    help = "Report worker import time and app registry cost by module"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20)
+
+    def handle(self, *args, **options):
+        env = dict(os.environ)
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', PROBE],
+            cwd=settings.BASE_DIR, env=env,
+            capture_output=True, text=True
+        )
+        if result.returncode:
+            raise CommandError(result.stderr[-2000:])
+        probe = json.loads(result.stdout.strip().splitlines()[-1])
+        modules = parse_importtime(result.stderr.splitlines())
+        packages = defaultdict(float)
+        for name, (own, _) in modules.items():
+            packages[name.split('.')[0]] += own
+        top = options['top']
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"django.setup(): {probe['setup'] * 1000:.1f} ms, "
+            f"URLconf: {probe['urls'] * 1000:.1f} ms, "
+            f"{len(modules)} modules imported"))
+        self.stdout.write(self.style.MIGRATE_HEADING("Apps (ms):"))
+        self.stdout.write(
+            f"  {'app':24} {'import':>8} {'models':>8} {'ready':>8}")
+        for label, timing in sorted(
+                probe['apps'].items(),
+                key=lambda item: -sum(item[1].values())):
+            self.stdout.write(
+                f"  {label:24} {timing.get('import', 0) * 1000:8.1f} "
+                f"{timing.get('models', 0) * 1000:8.1f} "
+                f"{timing.get('ready', 0) * 1000:8.1f}")
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            "Packages by own import time (ms):"))
+        for name, own in sorted(
+                packages.items(), key=lambda item: -item[1])[:top]:
+            self.stdout.write(f"  {name:40} {own * 1000:8.1f}")
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            "Modules by cumulative import time (ms):"))
+        for name, (own, cumulative) in sorted(
+                modules.items(), key=lambda item: -item[1][1])[:top]:
+            self.stdout.write(
+                f"  {name:56} {cumulative * 1000:8.1f} {own * 1000:8.1f}")
@@ -0,0 +1,219 @@
+import gzip
+import re
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+# Формат combined, опционально с $request_time в конце (log_format timed
+# в infra/nginx.conf).
+LOG_LINE = re.compile(
+    r'(?P<addr>\S+) \S+ \S+ \[(?P<time>[^\]]+)\] '
+    r'"(?P<method>[A-Z]+) (?P<path>\S+) [^"]*" (?P<status>\d{3}) \S+'
+    r'(?: "[^"]*" "[^"]*")?(?: (?P<request_time>[\d.]+))?'
+)
+# Ресурсы с числовыми id и модели, из которых берутся локальные id.
+ID_PATH = re.compile(r'^/api/(recipes|users|ingredients|tags)/(\d+)(/.*)?$')
+RESOURCE_MODELS = {
+    'recipes': Recipe,
+    'users': User,
+    'ingredients': Ingredient,
+    'tags': Tag,
+}
+ID_PARAMS = {'author': 'users'}
+# Параметры со списком id через запятую.
+ID_LIST_PARAMS = {'ids': 'recipes'}
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+def read_log(paths):
+    for path in paths:
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8', errors='replace') as file:
+            for line in file:
+                match = LOG_LINE.match(line)
+                if match:
+                    yield match.groupdict()
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+    return values[index]
+
+
+class IdRewriter:
+    """Стабильное отображение боевых id на id синтетического набора."""
+
+    def __init__(self):
+        self.local_ids = {
+            resource: list(
+                model.objects.order_by('pk').values_list('pk', flat=True))
+            for resource, model in RESOURCE_MODELS.items()
+        }
+
+    def map_id(self, resource, value):
+        ids = self.local_ids[resource]
+        if not ids:
+            return value
+        return str(ids[int(value) % len(ids)])
+
+    def map_param(self, key, value):
+        if key in ID_PARAMS and value.isdigit():
+            return self.map_id(ID_PARAMS[key], value)
+        if key in ID_LIST_PARAMS:
+            return ','.join(
+                self.map_id(ID_LIST_PARAMS[key], item)
+                if item.strip().isdigit() else item
+                for item in value.split(',')
+            )
+        return value
+
+    def rewrite(self, path):
+        """Переписанный путь и шаблон эндпоинта для отчёта."""
+        parts = urlsplit(path)
+        route = parts.path
+        match = ID_PATH.match(parts.path)
+        if match:
+            resource, value, rest = match.groups()
+            rest = rest or ''
+            route = f'/api/{resource}/{self.map_id(resource, value)}{rest}'
+            endpoint = f'/api/{resource}/{{id}}{rest}'
+        else:
+            endpoint = parts.path
+        query = [
+            (key, self.map_param(key, value))
+            for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        ]
+        if query:
+            route = f'{route}?{urlencode(query, safe=",")}'
+        return route, endpoint
+
+
+class Command(BaseCommand):
+    help = ("Replay nginx access logs against a local instance. All "
+            "requests come from one address, so start the target with "
+            "THROTTLING_ENABLED=False, otherwise its rate and concurrency "
+            "limits answer 429 and the report measures the throttles")
+
+    def add_arguments(self, parser):
+        parser.add_argument('logs', nargs='+', help="access.log[.gz] files")
+        parser.add_argument('--target', default='http://localhost:8000')
+        parser.add_argument('--speedup', type=float, default=1.0,
+                            help="time compression, 0 replays at full speed")
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--limit', type=int, help="max requests")
+        parser.add_argument('--token', help="auth token for all requests")
+        parser.add_argument('--prefix', default='/api/',
+                            help="replay only paths with this prefix")
+
+    def handle(self, *args, **options):
+        if options['speedup'] < 0:
+            raise CommandError("--speedup must be >= 0.")
+        rewriter = IdRewriter()
+        session_local = threading.local()
+        headers = {'Accept-Encoding': 'gzip, br'}
+        if options['token']:
+            headers['Authorization'] = f"Token {options['token']}"
+        stats = defaultdict(lambda: {
+            'latencies': [], 'logged': [], 'errors': 0, 'client_errors': 0})
+        throttled = 0
+        lock = threading.Lock()
+        in_flight = threading.BoundedSemaphore(options['concurrency'] * 4)
+        skipped = 0
+
+        def send(method, url, endpoint):
+            nonlocal throttled
+            if not hasattr(session_local, 'session'):
+                session_local.session = requests.Session()
+            started = time.perf_counter()
+            try:
+                status = session_local.session.request(
+                    method, url, headers=headers, timeout=60).status_code
+            except requests.RequestException:
+                status = None
+            finally:
+                in_flight.release()
+            latency = time.perf_counter() - started
+            with lock:
+                entry = stats[f'{method} {endpoint}']
+                entry['latencies'].append(latency)
+                if status is None or status >= 500:
+                    entry['errors'] += 1
+                elif status >= 400:
+                    entry['client_errors'] += 1
+                    throttled += status == 429
+
+        first_log_time = None
+        replay_started = time.monotonic()
+        sent = 0
+        with ThreadPoolExecutor(options['concurrency']) as pool:
+            for record in read_log(options['logs']):
+                if (record['method'] not in SAFE_METHODS
+                        or not record['path'].startswith(options['prefix'])):
+                    skipped += 1
+                    continue
+                if options['limit'] and sent >= options['limit']:
+                    break
+                log_time = datetime.strptime(
+                    record['time'], '%d/%b/%Y:%H:%M:%S %z').timestamp()
+                if first_log_time is None:
+                    first_log_time = log_time
+                if options['speedup']:
+                    due = (log_time - first_log_time) / options['speedup']
+                    delay = due - (time.monotonic() - replay_started)
+                    if delay > 0:
+                        time.sleep(delay)
+                path, endpoint = rewriter.rewrite(record['path'])
+                if record['request_time']:
+                    # Время ответа в бою, для сравнения с воспроизведением.
+                    with lock:
+                        stats[f"{record['method']} {endpoint}"][
+                            'logged'].append(float(record['request_time']))
+                in_flight.acquire()
+                pool.submit(send, record['method'],
+                            options['target'].rstrip('/') + path, endpoint)
+                sent += 1
+        elapsed = time.monotonic() - replay_started
+        self.report(stats, sent, skipped, elapsed)
+        if throttled:
+            self.stderr.write(self.style.WARNING(
+                f"{throttled} requests were throttled (429): restart the "
+                f"target with THROTTLING_ENABLED=False to measure capacity."))
+
+    def report(self, stats, sent, skipped, elapsed):
+        self.stdout.write(
+            f"{'endpoint':48} {'count':>6} {'rps':>7} {'p50 ms':>8} "
+            f"{'p95 ms':>8} {'p99 ms':>8} {'log p95':>8} "
+            f"{'5xx %':>6} {'4xx %':>6}")
+        for endpoint, entry in sorted(
+                stats.items(), key=lambda item: -len(item[1]['latencies'])):
+            latencies = entry['latencies']
+            count = len(latencies)
+            if not count:
+                continue
+            logged = (
+                f"{percentile(entry['logged'], 95) * 1000:8.1f}"
+                if entry['logged'] else f"{'-':>8}"
+            )
+            self.stdout.write(
+                f"{endpoint[:48]:48} {count:6} {count / elapsed:7.1f} "
+                f"{percentile(latencies, 50) * 1000:8.1f} "
+                f"{percentile(latencies, 95) * 1000:8.1f} "
+                f"{percentile(latencies, 99) * 1000:8.1f} {logged} "
+                f"{entry['errors'] / count * 100:6.1f} "
+                f"{entry['client_errors'] / count * 100:6.1f}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Replayed {sent} requests in {elapsed:.1f} s "
+            f"({sent / elapsed if elapsed else 0:.1f} rps), "
+            f"skipped {skipped}."))
@@ -0,0 +1,136 @@
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import combinations
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from django.urls import resolve
+
+from recipes.models import Recipe, Tag
+
+_local = threading.local()
+
+
+def fetch_local(url):
+    """Запрос к представлению внутри процесса, без ограничений частоты."""
+    request = RequestFactory().get(url, HTTP_ACCEPT_ENCODING='gzip, br')
+    match = resolve(request.path)
+    view = match.func.cls.as_view(
+        match.func.actions, **{**match.func.initkwargs, 'throttle_classes': ()}
+    )
+    try:
+        return view(request, *match.args, **match.kwargs).status_code
+    finally:
+        connection.close()
+
+
+def fetch_http(base_url):
+    def fetch(url):
+        if not hasattr(_local, 'session'):
+            _local.session = requests.Session()
+        return _local.session.get(
+            base_url.rstrip('/') + url,
+            headers={'Accept-Encoding': 'gzip, br'},
+            timeout=30
+        ).status_code
+    return fetch
+
+
+class Command(BaseCommand):
+    help = "Pre-populate API response caches, e.g. as a deploy step"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url', help="warm a running instance over HTTP, "
+            "e.g. http://localhost:8000 (default: in-process)")
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--budget', type=float, default=60,
+                            help="time budget in seconds")
+        parser.add_argument('--pages', type=int, default=3)
+        parser.add_argument('--limit', type=int, default=6,
+                            help="page size used by the frontend")
+        parser.add_argument('--max-tags', type=int, default=2,
+                            help="largest tag combination besides all tags")
+        parser.add_argument('--details', type=int, default=50,
+                            help="number of popular recipe details")
+
+    def build_urls(self, options):
+        urls = [('lists', '/api/tags/'), ('lists', '/api/ingredients/')]
+        slugs = list(Tag.objects.order_by('pk').values_list('slug', flat=True))
+        combos = {
+            combo
+            for size in range(min(options['max_tags'], len(slugs)) + 1)
+            for combo in combinations(slugs, size)
+        }
+        combos.add(tuple(slugs))
+        for page in range(1, options['pages'] + 1):
+            for combo in sorted(combos, key=len):
+                tags = ''.join(f'&tags={slug}' for slug in combo)
+                urls.append((
+                    'pages',
+                    f'/api/recipes/?page={page}&limit={options["limit"]}'
+                    f'{tags}'
+                ))
+        popular = (
+            Recipe.objects.order_by('-popularity', '-pub_date')
+            .values_list('pk', flat=True)[:options['details']]
+        )
+        urls.extend(('details', f'/api/recipes/{pk}/') for pk in popular)
+        return urls
+
+    def warm(self, fetch, group, url, deadline):
+        if time.monotonic() > deadline:
+            return group, url, None, 0
+        started = time.monotonic()
+        try:
+            status = fetch(url)
+        except Exception as exc:
+            status = f'{type(exc).__name__}: {exc}'
+        return group, url, status, time.monotonic() - started
+
+    def handle(self, *args, **options):
+        if options['url']:
+            fetch = fetch_http(options['url'])
+        else:
+            fetch = fetch_local
+            backend = settings.CACHES['default']['BACKEND']
+            if backend.endswith('LocMemCache'):
+                self.stderr.write(self.style.WARNING(
+                    "The default cache is per-process LocMemCache: warming "
+                    "in-process will not help the app workers, use --url."))
+        urls = self.build_urls(options)
+        started = time.monotonic()
+        deadline = started + options['budget']
+        with ThreadPoolExecutor(options['workers']) as pool:
+            results = list(pool.map(
+                lambda item: self.warm(fetch, *item, deadline), urls))
+
+        report = defaultdict(Counter)
+        for group, url, status, seconds in results:
+            if status is None:
+                outcome = 'skipped'
+            elif status == 200:
+                outcome = 'warmed'
+            elif status == 404 and group == 'pages':
+                outcome = 'empty'
+            else:
+                outcome = 'failed'
+                self.stderr.write(f"{url}: {status}")
+            report[group][outcome] += 1
+            report[group]['seconds'] += seconds
+            if options['verbosity'] > 1:
+                self.stdout.write(
+                    f"{outcome:8} {seconds * 1000:8.1f} ms {url}")
+        for group, counts in report.items():
+            self.stdout.write(
+                f"{group:8} warmed {counts['warmed']}, "
+                f"empty {counts['empty']}, failed {counts['failed']}, "
+                f"skipped {counts['skipped']}, "
+                f"{counts['seconds']:.2f} s")
+        self.stdout.write(self.style.SUCCESS(
+            f"Done in {time.monotonic() - started:.2f} s."))
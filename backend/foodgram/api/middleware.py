@@ -0,0 +1,124 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.models import Max
+
+from recipes.changes import latest_cursor, published
+from .caching import invalidate
+from .profiling import RequestProfiler, request_token, token_user
+from .queries import QueryInspector, view_budget
+
+logger = logging.getLogger(__name__)
+
+# Какие пространства имён кэша ответов устаревают от изменений в журнале.
+CHANGE_NAMESPACES = {
+    'recipe': ('recipes',),
+    'tag': ('tags', 'recipes'),
+    'ingredient': ('ingredients', 'recipes'),
+    'author': ('recipes',),
+}
+
+
+class ChangeFeedInvalidationMiddleware:
+    """Сброс локального кэша по изменениям из других воркеров.
+
+    Сигналы сбрасывают версии только в кэше своего процесса; при
+    LocMemCache остальные воркеры узнают об изменениях из журнала,
+    опрашивая его не чаще раза в CHANGE_FEED_POLL секунд. С общим
+    кэшем (memcached, redis) middleware не подключается.
+    """
+
+    def __init__(self, get_response):
+        if not isinstance(caches['default'], LocMemCache):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.cursor = None
+        self.polled = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, request):
+        self.poll()
+        return self.get_response(request)
+
+    def poll(self):
+        interval = getattr(settings, 'CHANGE_FEED_POLL', 1)
+        if time.monotonic() - self.polled < interval:
+            return
+        if not self.lock.acquire(blocking=False):
+            return
+        try:
+            self.polled = time.monotonic()
+            if self.cursor is None:
+                self.cursor = latest_cursor()
+                return
+            kinds = dict(
+                published().filter(seq__gt=self.cursor)
+                .values_list('kind').annotate(last=Max('seq'))
+                .order_by()
+            )
+            if not kinds:
+                return
+            namespaces = set()
+            for kind in kinds:
+                namespaces.update(CHANGE_NAMESPACES.get(kind, ()))
+            invalidate(*namespaces)
+            self.cursor = max(kinds.values())
+        finally:
+            self.lock.release()
+
+
+class QueryInspectorMiddleware:
+    """Поиск N+1 и проверка бюджетов запросов в режиме разработки.
+
+    Включается настройкой QUERY_INSPECTOR (по умолчанию при DEBUG):
+    пишет в лог повторяющиеся запросы с местом вызова и превышение
+    query_budgets у действия viewset'а, число запросов отдаёт в
+    заголовке X-Query-Count.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_INSPECTOR', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        inspector = QueryInspector()
+        with inspector.watch():
+            response = self.get_response(request)
+        action, budget = None, None
+        if request.resolver_match is not None:
+            action, budget = view_budget(
+                request.resolver_match.func, request.method)
+        for problem in inspector.problems(budget):
+            logger.warning('%s %s [%s]: %s', request.method,
+                           request.path, action or '-', problem)
+        response['X-Query-Count'] = len(inspector.queries)
+        return response
+
+
+class RequestProfilerMiddleware:
+    """Профилирование отдельного запроса по токену сотрудника.
+
+    Токен выдаётся в админке профилей и передаётся в заголовке
+    X-Profile или параметре ?_profile=. Профиль и SQL сохраняются,
+    id профиля возвращается в заголовке X-Profile-Id.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = request_token(request)
+        user = token_user(token) if token else None
+        if user is None:
+            return self.get_response(request)
+        profiler = RequestProfiler()
+        with profiler.capture():
+            response = self.get_response(request)
+        response['X-Profile-Id'] = profiler.save(request, response, user).pk
+        return response
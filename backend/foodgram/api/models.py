@@ -0,0 +1,58 @@
+from django.db import models
+from django.utils import timezone
+
+from users.models import User
+
+
+class RequestProfile(models.Model):
+    """Профиль одного запроса, снятый по требованию сотрудника."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='request_profiles',
+        verbose_name='Запросил'
+    )
+    created = models.DateTimeField(
+        'Дата',
+        default=timezone.now,
+        db_index=True
+    )
+    method = models.CharField(
+        'Метод',
+        max_length=10
+    )
+    path = models.TextField(
+        'Адрес'
+    )
+    status = models.PositiveSmallIntegerField(
+        'Код ответа'
+    )
+    duration = models.FloatField(
+        'Время, мс'
+    )
+    query_count = models.PositiveIntegerField(
+        'Запросов к БД'
+    )
+    query_time = models.FloatField(
+        'Время в БД, мс'
+    )
+    stats = models.TextField(
+        'Функции по суммарному времени'
+    )
+    queries = models.JSONField(
+        'SQL'
+    )
+    file = models.CharField(
+        'Файл pstats',
+        max_length=255
+    )
+
+    class Meta:
+        ordering = ['-created']
+        verbose_name = 'Профиль запроса'
+        verbose_name_plural = 'Профили запросов'
+
+    def __str__(self):
+        return f'{self.method} {self.path} ({self.duration:.0f} мс)'
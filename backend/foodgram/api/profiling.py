@@ -0,0 +1,118 @@
+import cProfile
+import io
+import os
+import pstats
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+from users.models import User
+from .models import RequestProfile
+from .queries import QueryInspector
+
+HEADER = 'HTTP_X_PROFILE'
+PARAM = '_profile'
+SALT = 'api.profiling'
+STATS_LIMIT = 60
+
+
+def make_token(user):
+    """Подписанный токен, включающий профилирование запросов."""
+    return signing.TimestampSigner(salt=SALT).sign(str(user.pk))
+
+
+def token_user(token):
+    """Сотрудник, выпустивший ещё действующий токен, или None."""
+    try:
+        pk = signing.TimestampSigner(salt=SALT).unsign(
+            token, max_age=settings.PROFILER_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    return User.objects.filter(pk=pk, is_staff=True, is_active=True).first()
+
+
+def request_token(request):
+    """Токен из заголовка X-Profile или параметра ?_profile=.
+
+    Строка запроса разбирается только если в ней есть параметр,
+    так что обычные запросы ничего не платят.
+    """
+    token = request.META.get(HEADER)
+    if token is None and PARAM in request.META.get('QUERY_STRING', ''):
+        token = request.GET.get(PARAM)
+    return token
+
+
+def profile_path(name):
+    return os.path.join(settings.PROFILER_ROOT, name)
+
+
+def enforce_retention():
+    """Оставить не больше PROFILER_MAX_PROFILES свежих профилей."""
+    expired = RequestProfile.objects.filter(
+        created__lt=timezone.now() - timedelta(
+            days=settings.PROFILER_MAX_AGE_DAYS))
+    for profile in expired:
+        profile.delete()
+    for profile in RequestProfile.objects.all()[
+            settings.PROFILER_MAX_PROFILES:]:
+        profile.delete()
+
+
+class RequestProfiler:
+    """cProfile и SQL одного запроса с сохранением на диск."""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.inspector = QueryInspector()
+        self.duration = 0
+
+    @contextmanager
+    def capture(self):
+        with self.inspector.watch():
+            started = time.perf_counter()
+            self.profile.enable()
+            try:
+                yield self
+            finally:
+                self.profile.disable()
+                self.duration = time.perf_counter() - started
+
+    def save(self, request, response, user):
+        os.makedirs(settings.PROFILER_ROOT, exist_ok=True)
+        name = f'{timezone.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}.prof'
+        self.profile.dump_stats(profile_path(name))
+        stream = io.StringIO()
+        pstats.Stats(self.profile, stream=stream).sort_stats(
+            'cumulative').print_stats(STATS_LIMIT)
+        params = request.GET.copy()
+        params.pop(PARAM, None)
+        path = request.path + (f'?{params.urlencode()}' if params else '')
+        queries = self.inspector.queries
+        profile = RequestProfile.objects.create(
+            user=user,
+            method=request.method,
+            path=path,
+            status=response.status_code,
+            duration=self.duration * 1000,
+            query_count=len(queries),
+            query_time=sum(query.duration for query in queries) * 1000,
+            stats=stream.getvalue(),
+            queries=[
+                {
+                    'sql': query.sql,
+                    'site': query.site,
+                    'serializer': query.serializer,
+                    'ms': round(query.duration * 1000, 3)
+                }
+                for query in queries
+            ],
+            file=name
+        )
+        enforce_retention()
+        return profile
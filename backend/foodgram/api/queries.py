@@ -0,0 +1,109 @@
+import os
+import re
+import sys
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.serializers import BaseSerializer
+
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+class Query(NamedTuple):
+    sql: str
+    site: str
+    serializer: str
+    duration: float
+
+
+def normalize_sql(sql):
+    """SQL без значений: запросы, отличающиеся только ими, совпадут."""
+    return LITERAL.sub('?', IN_LIST.sub('IN (...)', sql))
+
+
+def call_site():
+    """Строка проекта, выполнившая запрос, и метод сериализатора над ней."""
+    root = str(settings.BASE_DIR) + os.sep
+    site = serializer = None
+    frame = sys._getframe(2)
+    while frame is not None and (site is None or serializer is None):
+        code = frame.f_code
+        if (site is None and code.co_filename.startswith(root)
+                and code.co_filename != __file__):
+            site = (f'{os.path.relpath(code.co_filename, root)}:'
+                    f'{frame.f_lineno} in {code.co_name}')
+        if serializer is None:
+            # type(), а не isinstance(): isinstance() вычислил бы
+            # ленивые объекты вроде request.user прямо внутри запроса.
+            owner = type(frame.f_locals.get('self'))
+            if issubclass(owner, BaseSerializer):
+                serializer = f'{owner.__name__}.{code.co_name}'
+        frame = frame.f_back
+    return site or '?', serializer or ''
+
+
+def view_budget(view, method):
+    """Действие viewset'а и его бюджет запросов из query_budgets."""
+    actions = getattr(view, 'actions', None) or {}
+    action = actions.get(method.lower())
+    budgets = getattr(getattr(view, 'cls', None), 'query_budgets', {})
+    return action, budgets.get(action)
+
+
+class QueryInspector:
+    """Запросы к базе за время запроса, сгруппированные по шаблону.
+
+    Одинаковый SQL из одной и той же строки кода, повторённый
+    QUERY_REPEAT_THRESHOLD раз и больше, почти наверняка N+1.
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        site, serializer = call_site()
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(Query(
+                normalize_sql(sql), site, serializer,
+                time.perf_counter() - started
+            ))
+
+    @contextmanager
+    def watch(self):
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(
+                    connections[alias].execute_wrapper(self))
+            yield self
+
+    def repeated(self, threshold=None):
+        if threshold is None:
+            threshold = getattr(settings, 'QUERY_REPEAT_THRESHOLD', 3)
+        groups = defaultdict(list)
+        for query in self.queries:
+            groups[(query.sql, query.site)].append(query)
+        return [
+            queries for queries in groups.values()
+            if len(queries) >= threshold
+        ]
+
+    def problems(self, budget=None):
+        """Описания повторяющихся запросов и превышения бюджета."""
+        problems = []
+        if budget is not None and len(self.queries) > budget:
+            problems.append(
+                f'{len(self.queries)} queries, budget is {budget}')
+        for queries in self.repeated():
+            query = queries[0]
+            owner = f' ({query.serializer})' if query.serializer else ''
+            problems.append(
+                f'{len(queries)}x at {query.site}{owner}: {query.sql[:200]}')
+        return problems
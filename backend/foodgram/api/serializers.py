@@ -5,20 +5,27 @@ from django.contrib.auth.hashers import make_password
 from django.core.files.base import ContentFile
 from django.db import transaction
 from djoser.serializers import UserCreateSerializer, UserSerializer
-from drf_base64.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
-from recipes.models import (Favorite, Ingredient, Recipe, Recipe_is_ingredient,
-                            Shopping_cart, Tag)
-from users.models import Subscribe, User
+from recipes.models import Ingredient, Recipe, Recipe_is_ingredient, Tag
+from recipes.similarity import schedule_signatures
+from users.models import User
+from .loaders import ViewerStateListSerializer, viewer_state
+from .sparse import SparseFieldsMixin
+from .uploads import UPLOAD_ID, resolve_upload
 
 
+class Base64ImageField(serializers.ImageField):
+    """Сериализатор для работы и проверки изображений.
 
-class Base64ImageField(serializers.ImageField): # noqa
-    """Сериализатор для работы и проверки изображений."""
+    Кроме base64 принимает id объекта, загруженного по слоту
+    /api/uploads/: файл уже лежит в хранилище и не копируется.
+    """
 
     def to_internal_value(self, data):
+        if isinstance(data, str) and UPLOAD_ID.match(data):
+            return resolve_upload(data)
         try:
             if isinstance(data, str) and data.startswith('data:image'):
                 format, imgstr = data.split(';base64,')
@@ -30,7 +37,7 @@ class Base64ImageField(serializers.ImageField): # noqa
         return super().to_internal_value(data)
 
 
-class UserReadSerializer(UserSerializer):
+class UserReadSerializer(SparseFieldsMixin, UserSerializer):
     """Сериализатор пользователя с информацией о подписках."""
 
     is_subscribed = serializers.SerializerMethodField()
@@ -45,17 +52,14 @@ class UserReadSerializer(UserSerializer):
             'last_name',
             'is_subscribed'
         )
+        list_serializer_class = ViewerStateListSerializer
 
-    def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        user = (
-            request.user if request and not request.user.is_anonymous
-            else None
-        )
+    def prime_viewer_state(self, loader, users):
+        if 'is_subscribed' in self.fields:
+            loader.prime('subscribed', [user.pk for user in users])
 
-        if user and Subscribe.objects.filter(user=user, author=obj).exists():
-            return True
-        return False
+    def get_is_subscribed(self, obj):
+        return viewer_state(self.context).is_subscribed(obj.pk)
 
 
 class UserCreateSerializer(UserCreateSerializer):
@@ -130,7 +134,10 @@ class RecipeSerializer(serializers.ModelSerializer):
         )
 
 
-class SubscriptionsSerializer(serializers.ModelSerializer):
+class SubscriptionsSerializer(
+    SparseFieldsMixin,
+    serializers.ModelSerializer
+):
     """Сериализатор для списка подписок пользователя."""
 
     is_subscribed = serializers.SerializerMethodField()
@@ -149,13 +156,18 @@ class SubscriptionsSerializer(serializers.ModelSerializer):
             'recipes',
             'recipes_count'
         )
+        list_serializer_class = ViewerStateListSerializer
+
+    def prime_viewer_state(self, loader, users):
+        if 'is_subscribed' in self.fields:
+            loader.prime('subscribed', [user.pk for user in users])
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        return user.is_authenticated and Subscribe.objects.filter(
-            user=user, author=obj).exists()
+        return viewer_state(self.context).is_subscribed(obj.pk)
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.recipes.count()
 
     def get_recipes(self, obj):
@@ -199,9 +211,7 @@ class SubscribeAuthorSerializer(serializers.ModelSerializer):
         return obj
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        return user.is_authenticated and Subscribe.objects.filter(
-            user=user, author=obj).exists()
+        return viewer_state(self.context).is_subscribed(obj.pk)
 
     def get_recipes_count(self, obj):
         return obj.recipes.count()
@@ -212,7 +222,7 @@ class IngredientSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Ingredient
-        fields = '__all__'
+        fields = ('id', 'name', 'measurement_unit')
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -266,16 +276,19 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             'text',
             'cooking_time'
         )
+        list_serializer_class = ViewerStateListSerializer
+
+    @staticmethod
+    def prime_viewer_state(loader, recipes):
+        loader.prime('subscribed', {recipe.author_id for recipe in recipes})
+        loader.prime('favorited', [recipe.pk for recipe in recipes])
+        loader.prime('in_cart', [recipe.pk for recipe in recipes])
 
     def get_is_favorited(self, obj):
-        user = self.context.get('request').user
-        return user.is_authenticated and Favorite.objects.filter(
-            user=user, recipe=obj).exists()
+        return viewer_state(self.context).is_favorited(obj.pk)
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context.get('request').user
-        return user.is_authenticated and Shopping_cart.objects.filter(
-            user=user, recipe=obj).exists()
+        return viewer_state(self.context).is_in_shopping_cart(obj.pk)
 
 
 class RecipeIngredientCreateSerializer(serializers.ModelSerializer):
@@ -360,7 +373,8 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
         ingredient_ids = [ingredient['id'] for ingredient in ingredients]
-        if not Ingredient.objects.filter(pk__in=ingredient_ids).exists():
+        if (Ingredient.objects.filter(pk__in=ingredient_ids).count()
+                != len(set(ingredient_ids))):
             raise serializers.ValidationError(
                 'Ингирдиент не существуют, '
                 'выберети из существующих ингридиентов.'
@@ -373,12 +387,14 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         Recipe_is_ingredient.objects.bulk_create(
             [Recipe_is_ingredient(
                 recipe=recipe,
-                ingredient=Ingredient.objects.get(pk=ingredient['id']),
+                ingredient_id=ingredient['id'],
                 amount=ingredient['amount']
             ) for ingredient in ingredients]
         )
+        schedule_signatures([recipe.pk])
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         fields_to_update = ['image', 'name', 'text', 'cooking_time']
         tags = validated_data.pop('tags')
@@ -395,11 +411,13 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         Recipe_is_ingredient.objects.bulk_create(
             [Recipe_is_ingredient(
                 recipe=instance,
-                ingredient=Ingredient.objects.get(pk=ingredient['id']),
+                ingredient_id=ingredient['id'],
                 amount=ingredient['amount']
             ) for ingredient in ingredients]
         )
-        instance.save()
+        schedule_signatures([instance.pk])
+        # Рейтинги пишет update_scores: сохранять их из старой копии нельзя.
+        instance.save(update_fields=[*fields_to_update, 'tags_mask'])
         return instance
 
     def to_representation(self, instance):
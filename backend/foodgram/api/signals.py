@@ -0,0 +1,48 @@
+import os
+
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import Ingredient, Recipe, Recipe_is_ingredient, Tag
+from recipes.signals import recipes_bulk_created
+from users.models import User
+from .caching import invalidate
+from .models import RequestProfile
+from .profiling import profile_path
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tag_changed(sender, **kwargs):
+    invalidate('tags', 'recipes')
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    invalidate('ingredients', 'recipes')
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=Recipe_is_ingredient)
+@receiver(post_delete, sender=User)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(recipes_bulk_created)
+def recipe_changed(sender, **kwargs):
+    invalidate('recipes')
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, **kwargs):
+    """Сбросить кэш рецептов, только если изменились данные автора.
+
+    Флаг ставит recipes.signals.remember_author_fields.
+    """
+    if getattr(instance, 'author_fields_changed', False):
+        invalidate('recipes')
+
+
+@receiver(post_delete, sender=RequestProfile)
+def profile_deleted(sender, instance, **kwargs):
+    try:
+        os.remove(profile_path(instance.file))
+    except FileNotFoundError:
+        pass
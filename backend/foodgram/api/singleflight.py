@@ -0,0 +1,134 @@
+import math
+import random
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+MISSING = object()
+# Значение в кэше вместе со временем его вычисления и истечения.
+Entry = namedtuple('Entry', 'value delta expires')
+
+
+class Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.failed = False
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def lock_key(key):
+    return f'singleflight:{key}:lock'
+
+
+def result_key(key, token):
+    return f'singleflight:{key}:{token}'
+
+
+def run(key, compute, fallback=MISSING):
+    """Выполнить compute один раз на все одновременные вызовы с key.
+
+    Потоки воркера ждут вычисления лидера, другие воркеры — по
+    блокировке в кэше. Если задан fallback, вызов не ждёт чужое
+    вычисление и сразу возвращает fallback. Если лидер упал или
+    не уложился в SINGLEFLIGHT_WAIT, ожидающий считает сам.
+    """
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = Flight()
+    if not leader:
+        if fallback is not MISSING:
+            return fallback
+        if flight.done.wait(settings.SINGLEFLIGHT_WAIT) and not flight.failed:
+            return flight.result
+        return compute()
+    try:
+        flight.result = run_across_workers(key, compute, fallback)
+    except BaseException:
+        flight.failed = True
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+    return flight.result
+
+
+def run_across_workers(key, compute, fallback):
+    token = uuid.uuid4().hex
+    if cache.add(lock_key(key), token, settings.SINGLEFLIGHT_LOCK_TIMEOUT):
+        try:
+            result = compute()
+            # Результат живёт недолго: только для тех, кто уже ждёт.
+            cache.set(result_key(key, token), (result,),
+                      settings.SINGLEFLIGHT_WAIT)
+            return result
+        finally:
+            if cache.get(lock_key(key)) == token:
+                cache.delete(lock_key(key))
+    holder = cache.get(lock_key(key))
+    if holder is None:
+        return compute()
+    if fallback is not MISSING:
+        return fallback
+    deadline = time.monotonic() + settings.SINGLEFLIGHT_WAIT
+    while time.monotonic() < deadline:
+        # Лидер пишет результат до снятия блокировки.
+        released = cache.get(lock_key(key)) != holder
+        stored = cache.get(result_key(key, holder))
+        if stored is not None:
+            return stored[0]
+        if released:
+            break
+        time.sleep(settings.SINGLEFLIGHT_POLL)
+    return compute()
+
+
+def should_refresh(entry, beta):
+    """Раннее вероятностное обновление (XFetch).
+
+    Чем ближе истечение и чем дольше считалось значение, тем
+    вероятнее обновить его заранее, так что горячий ключ обычно
+    пересчитывает один запрос до того, как он истечёт у всех.
+    """
+    if entry.expires is None:
+        return False
+    gap = -entry.delta * beta * math.log(1 - random.random())
+    return time.time() + gap >= entry.expires
+
+
+def fetch(key, compute, timeout, beta=None):
+    """Значение из кэша; при промахе его вычисляет один запрос.
+
+    Значение None не кэшируется: каждый, кто его получил, решает
+    сам, что делать дальше.
+    """
+    if beta is None:
+        beta = settings.CACHE_EARLY_REFRESH_BETA
+    entry = cache.get(key)
+    fallback = MISSING
+    if isinstance(entry, Entry):
+        if not should_refresh(entry, beta):
+            return entry.value
+        # Пока обновление идёт в другом запросе, отдаём текущее значение.
+        fallback = entry.value
+
+    def refresh():
+        started = time.monotonic()
+        value = compute()
+        if value is not None:
+            expires = None if timeout is None else time.time() + timeout
+            cache.set(
+                key, Entry(value, time.monotonic() - started, expires),
+                timeout)
+        return value
+    return run(key, refresh, fallback)
@@ -0,0 +1,62 @@
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.exceptions import ValidationError
+
+FIELDS_PARAM = 'fields'
+OMIT_PARAM = 'omit'
+
+
+def split_names(value):
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def selected_fields(request, available):
+    """Поля ответа с учётом ?fields= и ?omit= в исходном порядке.
+
+    id остаётся всегда, иначе ответ не связать с объектами.
+    Неизвестное поле — ошибка 400, а не молча пустой ответ.
+    """
+    available = tuple(available)
+    if request is None:
+        return available
+    params = getattr(request, 'query_params', request.GET)
+    selected = set(available)
+    errors = {}
+    for param in (FIELDS_PARAM, OMIT_PARAM):
+        if param not in params:
+            continue
+        names = split_names(params[param])
+        unknown = names.difference(available)
+        if unknown:
+            errors[param] = f"Неизвестные поля: {', '.join(sorted(unknown))}."
+        elif param == FIELDS_PARAM:
+            selected &= names
+        else:
+            selected -= names
+    if errors:
+        raise ValidationError(errors)
+    return tuple(
+        name for name in available if name in selected or name == 'id')
+
+
+def model_fields(model, names):
+    """Поля модели среди имён: для .only() без вычисляемых полей."""
+    fields = []
+    for name in names:
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            continue
+        if field.concrete:
+            fields.append(field.attname)
+    return fields
+
+
+class SparseFieldsMixin:
+    """Сериализатор, отдающий только поля из ?fields= и ?omit=."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        selected = selected_fields(self.context.get('request'), self.fields)
+        for name in list(self.fields):
+            if name not in selected:
+                self.fields.pop(name)
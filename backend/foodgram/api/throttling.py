@@ -0,0 +1,189 @@
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.exceptions import Throttled
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 60 * 60 * 24}
+# Ожидание блокировки корзины: попытки, пауза между ними и время
+# жизни блокировки на случай падения воркера (с). Не дождавшись её,
+# запрос проверяется счётчиком окна (см. window_allows).
+BUCKET_LOCK_ATTEMPTS = 3
+BUCKET_LOCK_SLEEP = 0.002
+BUCKET_LOCK_TIMEOUT = 1
+
+
+def parse_rate(rate):
+    """'20/min' -> (20, 60)."""
+    count, period = rate.split('/')
+    return int(count), DURATIONS[period[0]]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Ограничение частоты запросов по алгоритму token bucket.
+
+    Область действия берётся из view.throttle_scopes по action,
+    затем из view.throttle_scope, иначе read/write по методу.
+    Состояние корзины хранится в кэше 'throttle' и меняется под
+    блокировкой в том же кэше.
+    """
+
+    prefix = None
+
+    def get_scope(self, request, view):
+        scopes = getattr(view, 'throttle_scopes', {})
+        scope = scopes.get(getattr(view, 'action', None))
+        if scope is None:
+            scope = getattr(view, 'throttle_scope', None)
+        if scope is None:
+            scope = 'read' if request.method in ('GET', 'HEAD') else 'write'
+        return scope
+
+    def get_ident_key(self, request):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        self.delay = None
+        if not settings.THROTTLING_ENABLED:
+            return True
+        ident = self.get_ident_key(request)
+        if ident is None:
+            return True
+        scope = self.get_scope(request, view)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(
+            f'{self.prefix}.{scope}')
+        if rate is None:
+            return True
+        capacity, duration = parse_rate(rate)
+        refill = capacity / duration
+        key = f'throttle:{self.prefix}:{scope}:{ident}'
+        cache = caches['throttle']
+        if not self.lock(cache, key):
+            if self.window_allows(cache, key, capacity, duration):
+                return True
+            self.delay = 1 / refill
+            return False
+        try:
+            now = time.time()
+            tokens, updated = cache.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill)
+            if tokens < 1:
+                self.delay = (1 - tokens) / refill
+                return False
+            cache.set(key, (tokens - 1, now), duration)
+            return True
+        finally:
+            cache.delete(f'{key}:lock')
+
+    def lock(self, cache, key):
+        """Заблокировать корзину на время чтения и записи.
+
+        Иначе параллельные запросы потратят одни и те же токены.
+        """
+        for _ in range(BUCKET_LOCK_ATTEMPTS):
+            if cache.add(f'{key}:lock', 1, BUCKET_LOCK_TIMEOUT):
+                return True
+            time.sleep(BUCKET_LOCK_SLEEP)
+        return False
+
+    def window_allows(self, cache, key, capacity, duration):
+        """Запасная проверка, пока корзину держит другой запрос.
+
+        Атомарный счётчик запросов в текущем окне duration: грубее
+        корзины, но не отказывает зря при обычной конкуренции за ключ.
+        """
+        window = f'{key}:window:{int(time.time() // duration)}'
+        cache.add(window, 0, duration)
+        try:
+            return cache.incr(window) <= capacity
+        except ValueError:
+            return True
+
+    def wait(self):
+        return self.delay
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    """Ограничение для авторизованного пользователя."""
+
+    prefix = 'user'
+
+    def get_ident_key(self, request):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return None
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    """Ограничение по IP-адресу клиента."""
+
+    prefix = 'ip'
+
+    def get_ident_key(self, request):
+        return self.get_ident(request)
+
+
+def acquire_slot(name):
+    """Занять место в общем счётчике одновременных вызовов.
+
+    Счётчик лежит в кэше 'throttle', поэтому при общем бэкенде
+    (Redis, memcached) лимит действует на все воркеры сразу. Ключ
+    живёт CONCURRENCY_TTL секунд после последнего захвата, так что
+    места упавших воркеров со временем освобождаются.
+    """
+    if not settings.THROTTLING_ENABLED:
+        return True
+    cache = caches['throttle']
+    key = f'concurrency:{name}'
+    for _ in range(2):
+        cache.add(key, 0, settings.CONCURRENCY_TTL)
+        try:
+            count = cache.incr(key)
+            break
+        except ValueError:
+            # Ключ истёк между add и incr.
+            continue
+    else:
+        return True
+    cache.touch(key, settings.CONCURRENCY_TTL)
+    if count < 1:
+        # Счётчик ушёл в минус после истечения ключа.
+        cache.set(key, 1, settings.CONCURRENCY_TTL)
+    elif count > settings.CONCURRENCY_LIMITS[name]:
+        release_slot(name)
+        return False
+    return True
+
+
+def release_slot(name):
+    if not settings.THROTTLING_ENABLED:
+        return
+    try:
+        caches['throttle'].decr(f'concurrency:{name}')
+    except ValueError:
+        pass
+
+
+def concurrency_limit(name):
+    """Ограничить число одновременных вызовов действия.
+
+    Сверх лимита запрос сразу получает 429 с заголовком Retry-After.
+    """
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            if not acquire_slot(name):
+                raise Throttled(
+                    wait=settings.CONCURRENCY_RETRY_AFTER,
+                    detail='Сервер занят, повторите запрос позже.'
+                )
+            try:
+                return method(*args, **kwargs)
+            finally:
+                release_slot(name)
+        return wrapper
+    return decorator
@@ -0,0 +1,101 @@
+import os
+import re
+import time
+import uuid
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from django.conf import settings
+from django.utils.crypto import constant_time_compare, salted_hmac
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+
+from recipes.storage import UPLOAD_DIR, content_storage
+
+SALT = 'api.uploads'
+# Тип содержимого -> (расширение, формат Pillow).
+CONTENT_TYPES = {
+    'image/jpeg': ('jpg', 'JPEG'),
+    'image/png': ('png', 'PNG'),
+    'image/gif': ('gif', 'GIF'),
+    'image/webp': ('webp', 'WEBP'),
+}
+EXTENSIONS = dict(CONTENT_TYPES.values())
+UPLOAD_ID = re.compile(
+    rf"^{UPLOAD_DIR}/[0-9a-f]{{32}}\.({'|'.join(EXTENSIONS)})$")
+
+
+def sign(key, expires, content_type):
+    return salted_hmac(
+        SALT, f'{key}:{expires}:{content_type}').hexdigest()
+
+
+def new_slot(content_type):
+    """Ключ объекта и подписанный адрес для PUT с сырыми байтами."""
+    if content_type not in CONTENT_TYPES:
+        raise ValidationError({
+            'content_type': f"Допустимые типы: {', '.join(CONTENT_TYPES)}."
+        })
+    extension = CONTENT_TYPES[content_type][0]
+    key = f'{UPLOAD_DIR}/{uuid.uuid4().hex}.{extension}'
+    expires = int(time.time()) + settings.UPLOAD_SLOT_TTL
+    query = urlencode({
+        'expires': expires,
+        'signature': sign(key, expires, content_type)
+    })
+    name = key[len(UPLOAD_DIR) + 1:]
+    return {
+        'id': key,
+        'upload_url': f'{settings.UPLOAD_URL}{name}?{query}',
+        'method': 'PUT',
+        'headers': {'Content-Type': content_type},
+        'expires': expires,
+        'max_size': settings.UPLOAD_MAX_SIZE
+    }
+
+
+def check_put(uri, content_type, content_length):
+    """Ключ объекта, если PUT на uri разрешён слотом, иначе None.
+
+    Вызывается и для локальной загрузки, и из auth_request nginx,
+    который передаёт только заголовки запроса.
+    """
+    url = urlparse(uri)
+    if not url.path.startswith(settings.UPLOAD_URL):
+        return None
+    key = f'{UPLOAD_DIR}/{url.path[len(settings.UPLOAD_URL):]}'
+    params = {name: values[0] for name, values in parse_qs(url.query).items()}
+    try:
+        expires = int(params.get('expires', ''))
+        length = int(content_length)
+    except ValueError:
+        return None
+    if (not UPLOAD_ID.match(key)
+            or expires < time.time()
+            or not 0 < length <= settings.UPLOAD_MAX_SIZE
+            or not constant_time_compare(
+                params.get('signature', ''),
+                sign(key, expires, content_type))
+            or content_storage.exists(key)):
+        return None
+    return key
+
+
+def resolve_upload(key):
+    """Проверить загруженный объект, на который ссылается рецепт.
+
+    Pillow читает только заголовок файла, так что проверка не
+    загружает изображение целиком.
+    """
+    if not UPLOAD_ID.match(key) or not content_storage.exists(key):
+        raise ValidationError('Загрузка не найдена или не завершена.')
+    if content_storage.size(key) > settings.UPLOAD_MAX_SIZE:
+        raise ValidationError('Файл слишком большой.')
+    expected = EXTENSIONS[os.path.splitext(key)[1][1:]]
+    try:
+        with content_storage.open(key) as file, Image.open(file) as image:
+            image_format = image.format
+    except (OSError, Image.DecompressionBombError):
+        image_format = None
+    if image_format != expected:
+        raise ValidationError('Загруженный файл не является изображением.')
+    return key
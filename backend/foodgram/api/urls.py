@@ -8,6 +8,10 @@ router.register('recipes', views.RecipeViewSet)
 router.register('tags', views.TagViewSet)
 router.register('users', views.UserViewSet)
 router.register('ingredients', views.IngredientViewSet)
+router.register('changes', views.ChangeViewSet, basename='changes')
+router.register('uploads', views.UploadViewSet, basename='uploads')
+router.register(
+    'db-stats', views.ConnectionStatsViewSet, basename='db-stats')
 
 urlpatterns = router.urls
 
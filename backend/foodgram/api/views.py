@@ -1,18 +1,30 @@
+import os
 from datetime import datetime
 
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, OuterRef, Prefetch, Subquery, Sum
+from django.http import HttpResponse, HttpResponseNotAllowed
 from django.shortcuts import get_object_or_404
+from django.views.decorators.csrf import csrf_exempt
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import filters, status, viewsets
+from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 
+from foodgram.db.lifecycle import stats as connection_stats
 from users.models import Subscribe, User
 from recipes.models import (Favorite, Ingredient, Recipe, Recipe_is_ingredient,
                             Shopping_cart, Tag)
-from .filters import RecipeFilter
+from recipes.changes import CursorExpired, changes_since, latest_cursor
+from recipes.similarity import similar_recipe_ids
+from recipes.storage import content_storage
+from .caching import CachedResponseMixin
+from .facets import facet_counts, requested_facets
+from .fast_serializers import serialize_recipes
+from .filters import IngredientFilter, RecipeFilter
 from .pagination import CustomPaginator
 from .permissions import IsAuthorOrReadOnly
 from .serializers import (IngredientSerializer, RecipeCreateSerializer,
@@ -20,6 +32,44 @@ from .serializers import (IngredientSerializer, RecipeCreateSerializer,
                           SetPasswordSerializer, SubscribeAuthorSerializer,
                           SubscriptionsSerializer, TagSerializer,
                           UserCreateSerializer, UserReadSerializer)
+from .singleflight import run
+from .sparse import model_fields, selected_fields
+from .throttling import concurrency_limit
+from .uploads import check_put, new_slot
+
+SIMILAR_LIMIT = 6
+SIMILAR_MAX_LIMIT = 50
+
+
+def parse_ids(value):
+    """Id из строки вида 1,2,3 без повторов и в исходном порядке."""
+    try:
+        ids = [int(pk) for pk in value.split(',') if pk.strip()]
+    except ValueError:
+        raise ValidationError({'ids': 'Ожидается список id через запятую.'})
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise ValidationError({'ids': 'Список id пуст.'})
+    if len(ids) > settings.RECIPE_BATCH_LIMIT:
+        raise ValidationError({
+            'ids': f'Не больше {settings.RECIPE_BATCH_LIMIT} рецептов '
+                   f'за запрос.'
+        })
+    return ids
+
+
+def parse_recipes_limit(value):
+    """?recipes_limit= подписок: None без лимита, иначе число >= 0."""
+    if not value:
+        return None
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = -1
+    if limit < 0:
+        raise ValidationError(
+            {'recipes_limit': 'Ожидается неотрицательное целое число.'})
+    return limit
 
 
 class UserViewSet(
@@ -31,17 +81,31 @@ class UserViewSet(
     queryset = User.objects.all()
     permission_classes = (AllowAny,)
     pagination_class = CustomPaginator
+    query_budgets = {
+        'list': 4,
+        'retrieve': 3,
+        'me': 1,
+        'subscriptions': 5,
+    }
 
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
             return UserReadSerializer
         return UserCreateSerializer
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            queryset = queryset.only(*model_fields(User, selected_fields(
+                self.request, UserReadSerializer.Meta.fields)))
+        return queryset
+
     @action(detail=False, methods=['get'],
             pagination_class=None,
             permission_classes=(IsAuthenticated,))
     def me(self, request):
-        serializer = UserReadSerializer(request.user)
+        serializer = UserReadSerializer(
+            request.user, context={'request': request})
         return Response(serializer.data,
                         status=status.HTTP_200_OK)
 
@@ -62,7 +126,33 @@ class UserViewSet(
     @action(detail=False, methods=['get'],
             permission_classes=(IsAuthenticated,))
     def subscriptions(self, request):
-        queryset = User.objects.filter(subscribing__user=request.user)
+        fields = selected_fields(
+            request, SubscriptionsSerializer.Meta.fields)
+        queryset = (
+            User.objects.filter(subscribing__user=request.user)
+            .only(*model_fields(User, fields))
+            .order_by('id')
+        )
+        if 'recipes_count' in fields:
+            queryset = queryset.annotate(
+                recipes_count=Count('recipes', distinct=True))
+        if 'recipes' in fields:
+            recipes = Recipe.objects.only(
+                'id', 'name', 'image', 'cooking_time', 'author_id')
+            limit = parse_recipes_limit(
+                request.query_params.get('recipes_limit'))
+            if limit == 0:
+                recipes = recipes.none()
+            elif limit is not None:
+                # Лимит на автора в SQL: у плодовитого автора не
+                # загружаются все рецепты ради первых нескольких.
+                recipes = recipes.filter(pk__in=Subquery(
+                    Recipe.objects.filter(author=OuterRef('author'))
+                    .order_by('-pub_date')
+                    .values('pk')[:limit]
+                ))
+            queryset = queryset.prefetch_related(
+                Prefetch('recipes', queryset=recipes))
         paginate_queryset = self.paginate_queryset(queryset)
         serializer = SubscriptionsSerializer(
             paginate_queryset,
@@ -104,6 +194,7 @@ class UserViewSet(
 
 
 class IngredientViewSet(
+    CachedResponseMixin,
     viewsets.ModelViewSet,
     viewsets.GenericViewSet
 ):
@@ -113,11 +204,14 @@ class IngredientViewSet(
     permission_classes = (AllowAny,)
     serializer_class = IngredientSerializer
     pagination_class = None
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['^name']
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = IngredientFilter
+    cache_namespace = 'ingredients'
+    query_budgets = {'list': 3}
 
 
 class TagViewSet(
+    CachedResponseMixin,
     viewsets.ModelViewSet,
     viewsets.GenericViewSet
 ):
@@ -127,9 +221,11 @@ class TagViewSet(
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
+    cache_namespace = 'tags'
+    query_budgets = {'list': 1}
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     """Класс представления (ViewSet) для рецептов."""
 
     queryset = Recipe.objects.all()
@@ -138,12 +234,78 @@ class RecipeViewSet(viewsets.ModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     http_method_names = ['get', 'post', 'patch', 'create', 'delete']
+    cache_namespace = 'recipes'
+    cache_timeout = 60
+    cache_anonymous_only = True
+    throttle_scopes = {
+        'list': 'recipe_list',
+        'create': 'recipe_write',
+        'partial_update': 'recipe_write',
+        'download_shopping_cart': 'shopping_cart',
+    }
+    query_budgets = {
+        'list': 8,
+        'retrieve': 6,
+        'similar': 3,
+        'download_shopping_cart': 2,
+        'favorite': 7,
+        'unfavorite': 6,
+        'shopping_cart': 7,
+        'remove_from_shopping_cart': 6,
+    }
 
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
             return RecipeReadSerializer
         return RecipeCreateSerializer
 
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, self.list_recipes)
+
+    @concurrency_limit('recipe_write')
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
+    @concurrency_limit('recipe_write')
+    def partial_update(self, request, *args, **kwargs):
+        return super().partial_update(request, *args, **kwargs)
+
+    def list_recipes(self, request):
+        if 'ids' in request.query_params:
+            return self.batch_recipes(request)
+        facets = requested_facets(request)
+        filtered = self.filter_queryset(self.get_queryset())
+        queryset = filtered.values_list('id', flat=True)
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(serialize_recipes(queryset, request))
+        response = self.get_paginated_response(
+            serialize_recipes(page, request))
+        if facets:
+            response.data['facets'] = facet_counts(filtered, facets)
+        return response
+
+    def batch_recipes(self, request):
+        """Рецепты по ?ids=1,2,3 в запрошенном порядке, без пагинации.
+
+        Несуществующие id и рецепты, не прошедшие остальные фильтры,
+        пропускаются.
+        """
+        ids = parse_ids(request.query_params['ids'])
+        found = set(
+            self.filter_queryset(self.get_queryset())
+            .filter(pk__in=ids).values_list('id', flat=True)
+        )
+        return Response(serialize_recipes(
+            [pk for pk in ids if pk in found], request))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, self.retrieve_recipe)
+
+    def retrieve_recipe(self, request):
+        recipe = self.get_object()
+        return Response(serialize_recipes([recipe.pk], request)[0])
+
     @action(detail=True, methods=['post'],
             permission_classes=(IsAuthenticated,))
     def favorite(self, request, **kwargs):
@@ -152,7 +314,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
             user=request.user, recipe=recipe
         ).exists():
             favorite = Favorite(user=request.user, recipe=recipe)
-            favorite.save()
+            with transaction.atomic():
+                favorite.save()
             serializer = RecipeSerializer(recipe, context={"request": request})
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response({'errors': 'Рецепт есть избранном.'},
@@ -180,7 +343,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
             user=request.user, recipe=recipe
         ).exists():
             shopping_cart = Shopping_cart(user=request.user, recipe=recipe)
-            shopping_cart.save()
+            with transaction.atomic():
+                shopping_cart.save()
             serializer = RecipeSerializer(recipe, context={"request": request})
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response({'errors': 'Рецепт уже в списке покупок.'},
@@ -200,11 +364,48 @@ class RecipeViewSet(viewsets.ModelViewSet):
             status=status.HTTP_204_NO_CONTENT
         )
 
+    @action(detail=True, methods=['get'], pagination_class=None)
+    def similar(self, request, **kwargs):
+        recipe = self.get_object()
+        try:
+            limit = int(request.query_params.get('limit', SIMILAR_LIMIT))
+        except ValueError:
+            limit = SIMILAR_LIMIT
+        limit = max(1, min(limit, SIMILAR_MAX_LIMIT))
+        recipe_ids = similar_recipe_ids(recipe, limit)
+        recipes = Recipe.objects.in_bulk(recipe_ids)
+        serializer = RecipeSerializer(
+            [recipes[pk] for pk in recipe_ids if pk in recipes],
+            many=True,
+            context={'request': request}
+        )
+        return Response(serializer.data)
+
     @action(detail=False, methods=['get'],
             permission_classes=(IsAuthenticated,))
+    @concurrency_limit('shopping_cart')
     def download_shopping_cart(self, request, **kwargs):
+        # Повторные клики ждут уже идущую выгрузку того же пользователя.
+        shopping_cart_items_formatted = run(
+            f'shopping-cart:{request.user.pk}',
+            lambda: self.shopping_cart_lines(request.user)
+        )
+
+        current_datetime = datetime.now().strftime('%Y-%m-%d %H:%M:%A')
+        header = (
+            f"{'Лист покупок'.center(30)}\n"
+            f"Дата и время: {current_datetime}\n\n"
+        )
+
+        file_content = header + '\n'.join(shopping_cart_items_formatted)
+        response = HttpResponse(file_content, content_type='text/plain')
+        response['Content-Disposition'] = \
+            'attachment; filename="shopping_cart.txt"'
+        return response
+
+    def shopping_cart_lines(self, user):
         shopping_cart_recipes = Recipe.objects.filter(
-            shopping_recipe__user=request.user
+            shopping_recipe__user=user
         )
         shopping_cart_items = (
             Recipe_is_ingredient.objects
@@ -212,7 +413,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
             .values('ingredient__name', 'ingredient__measurement_unit')
             .annotate(total_amount=Sum('amount'))
         )
-        shopping_cart_items_formatted = [
+        return [
             (
                 f"{item['ingredient__name']} - {item['total_amount']} "
                 f"{item['ingredient__measurement_unit']}"
@@ -220,14 +421,115 @@ class RecipeViewSet(viewsets.ModelViewSet):
             for item in shopping_cart_items
         ]
 
-        current_datetime = datetime.now().strftime('%Y-%m-%d %H:%M:%A')
-        header = (
-            f"{'Лист покупок'.center(30)}\n"
-            f"Дата и время: {current_datetime}\n\n"
+
+class ChangeViewSet(viewsets.ViewSet):
+    """Лента изменений для инкрементальной синхронизации клиентов.
+
+    Без since возвращает текущий курсор; с since - изменения после
+    него: публичные и личные события текущего пользователя.
+    """
+
+    permission_classes = (AllowAny,)
+    query_budgets = {'list': 4}
+
+    def list(self, request):
+        since = request.query_params.get('since')
+        if since is None:
+            return Response({
+                'cursor': latest_cursor(),
+                'has_more': False,
+                'changes': []
+            })
+        try:
+            since = int(since)
+        except ValueError:
+            since = -1
+        if since < 0:
+            raise ValidationError(
+                {'since': 'Курсор должен быть неотрицательным числом.'})
+        try:
+            changes, cursor, has_more = changes_since(since, request.user)
+        except CursorExpired:
+            return Response(
+                {'detail': 'Курсор устарел, загрузите данные заново.'},
+                status=status.HTTP_410_GONE
+            )
+        return Response({
+            'cursor': cursor,
+            'has_more': has_more,
+            'changes': changes
+        })
+
+
+class ConnectionStatsViewSet(viewsets.ViewSet):
+    """Соединения с базой текущего процесса: открытые, занятые, простой.
+
+    Счётчики свои у каждого воркера, поэтому в ответе есть pid.
+    """
+
+    permission_classes = (IsAdminUser,)
+
+    def list(self, request):
+        return Response({'pid': os.getpid(), **connection_stats.snapshot()})
+
+
+class UploadViewSet(viewsets.ViewSet):
+    """Слоты для загрузки изображений напрямую в хранилище.
+
+    Клиент получает подписанный адрес, отправляет на него байты
+    методом PUT и передаёт id объекта в поле image рецепта.
+    Сами байты принимает nginx, спрашивая разрешение у authorize.
+    """
+
+    permission_classes = (IsAuthenticated,)
+    throttle_scopes = {'create': 'upload'}
+
+    def create(self, request):
+        slot = new_slot(request.data.get('content_type'))
+        slot['upload_url'] = request.build_absolute_uri(slot['upload_url'])
+        return Response(slot, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'], permission_classes=(AllowAny,),
+            throttle_classes=())
+    def authorize(self, request):
+        """Проверка для auth_request: по заголовкам, без тела запроса.
+
+        Частота загрузок уже ограничена выдачей слотов.
+        """
+        meta = request.META
+        allowed = meta.get('HTTP_X_ORIGINAL_METHOD') == 'PUT' and check_put(
+            meta.get('HTTP_X_ORIGINAL_URI', ''),
+            meta.get('HTTP_X_CONTENT_TYPE', ''),
+            meta.get('HTTP_X_CONTENT_LENGTH', '')
         )
+        return Response(status=(
+            status.HTTP_204_NO_CONTENT if allowed
+            else status.HTTP_403_FORBIDDEN
+        ))
 
-        file_content = header + '\n'.join(shopping_cart_items_formatted)
-        response = HttpResponse(file_content, content_type='text/plain')
-        response['Content-Disposition'] = \
-            'attachment; filename="shopping_cart.txt"'
-        return response
+
+@csrf_exempt
+def local_upload(request, name):
+    """Локальная замена объектного хранилища для разработки и тестов."""
+    if request.method != 'PUT':
+        return HttpResponseNotAllowed(['PUT'])
+    length = request.META.get('CONTENT_LENGTH', '')
+    key = check_put(
+        request.get_full_path(), request.META.get('CONTENT_TYPE', ''), length)
+    if key is None:
+        return HttpResponse(status=status.HTTP_403_FORBIDDEN)
+    path = content_storage.path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    received = 0
+    with open(f'{path}.part', 'wb') as file:
+        while True:
+            chunk = request.read(64 * 1024)
+            if not chunk:
+                break
+            received += len(chunk)
+            file.write(chunk)
+    if received != int(length):
+        os.remove(f'{path}.part')
+        return HttpResponse(status=status.HTTP_400_BAD_REQUEST)
+    os.replace(f'{path}.part', path)
+    return HttpResponse(status=status.HTTP_201_CREATED)
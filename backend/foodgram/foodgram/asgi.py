@@ -11,6 +11,7 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+# Отдельные настройки отключают постоянные соединения с базой.
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings_asgi')
 
 application = get_asgi_application()
@@ -0,0 +1,148 @@
+import random
+import threading
+import time
+import weakref
+
+from django.core.signals import request_finished, request_started
+from django.db import connections
+
+# Доля CONN_MAX_AGE, на которую случайно сокращается жизнь соединения,
+# чтобы воркеры, запущенные вместе, не переподключались одновременно.
+MAX_AGE_JITTER = 0.1
+HEALTH_CHECK_INTERVAL = 30
+
+
+class ConnectionStats:
+    """Счётчики соединений с базой в пределах процесса."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.wrappers = weakref.WeakSet()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.connects = 0
+            self.connect_time = 0.0
+            self.max_connect_time = 0.0
+            self.reused = 0
+            self.recycled = 0
+            self.health_checks = 0
+            self.health_check_failures = 0
+
+    def add(self, **counters):
+        with self.lock:
+            for name, value in counters.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def connected(self, duration):
+        with self.lock:
+            self.connects += 1
+            self.connect_time += duration
+            self.max_connect_time = max(self.max_connect_time, duration)
+
+    def snapshot(self):
+        """Счётчики и текущее состояние соединений всех потоков.
+
+        in_use — открытые соединения потоков, обрабатывающих запрос,
+        idle — открытые и ждущие следующего запроса.
+        """
+        with self.lock:
+            wrappers = list(self.wrappers)
+            open_ = [w for w in wrappers if w.connection is not None]
+            in_use = sum(1 for w in open_ if w.in_request)
+            return {
+                'open': len(open_),
+                'in_use': in_use,
+                'idle': len(open_) - in_use,
+                'connects': self.connects,
+                'connect_ms': round(self.connect_time * 1000, 3),
+                'avg_connect_ms': round(
+                    self.connect_time / self.connects * 1000, 3
+                ) if self.connects else 0,
+                'max_connect_ms': round(self.max_connect_time * 1000, 3),
+                'reused': self.reused,
+                'recycled': self.recycled,
+                'health_checks': self.health_checks,
+                'health_check_failures': self.health_check_failures,
+            }
+
+
+stats = ConnectionStats()
+
+
+class ManagedConnectionMixin:
+    """Постоянные соединения с проверкой и учётом для DatabaseWrapper.
+
+    Поверх CONN_MAX_AGE: время подключения попадает в stats, срок
+    жизни соединения случайно укорачивается на MAX_AGE_JITTER, а
+    простаивавшее дольше CONN_HEALTH_CHECK_INTERVAL соединение
+    проверяется в начале запроса, прежде чем им воспользуются.
+    Занятое соединение не проверяется: конец каждого запроса
+    сбрасывает отсчёт простоя.
+
+    Django вызывает close_if_unusable_or_obsolete и в начале, и в
+    конце запроса; обработчики request_boundary подключены позже
+    close_old_connections, поэтому in_request здесь ещё показывает,
+    какая это граница.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.in_request = False
+        self.checked_at = None
+        with stats.lock:
+            stats.wrappers.add(self)
+
+    @property
+    def health_check_interval(self):
+        return self.settings_dict.get(
+            'CONN_HEALTH_CHECK_INTERVAL', HEALTH_CHECK_INTERVAL)
+
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        stats.connected(time.perf_counter() - started)
+        self.checked_at = time.monotonic()
+        max_age = self.settings_dict['CONN_MAX_AGE']
+        if self.close_at is not None and max_age:
+            self.close_at -= random.uniform(0, max_age * MAX_AGE_JITTER)
+
+    def close_if_unusable_or_obsolete(self):
+        if self.connection is None:
+            return
+        if self.close_at is not None and time.monotonic() >= self.close_at:
+            stats.add(recycled=1)
+        super().close_if_unusable_or_obsolete()
+        if self.connection is None:
+            return
+        if self.in_request:
+            # Конец запроса: соединение только что отработало, и
+            # отсчёт простоя начинается заново без проверки.
+            self.checked_at = time.monotonic()
+            return
+        interval = self.health_check_interval
+        if interval is not None and (
+                time.monotonic() - self.checked_at >= interval):
+            self.checked_at = time.monotonic()
+            stats.add(health_checks=1)
+            if not self.is_usable():
+                stats.add(health_check_failures=1)
+                self.close()
+
+
+def request_boundary(in_request):
+    def handler(**kwargs):
+        for connection in connections.all():
+            if not isinstance(connection, ManagedConnectionMixin):
+                continue
+            if in_request and connection.connection is not None:
+                stats.add(reused=1)
+            connection.in_request = in_request
+    return handler
+
+
+request_started.connect(
+    request_boundary(True), weak=False, dispatch_uid='db_request_started')
+request_finished.connect(
+    request_boundary(False), weak=False, dispatch_uid='db_request_finished')
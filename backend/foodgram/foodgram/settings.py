@@ -14,6 +14,9 @@ ALLOWED_HOSTS = ['*']
 
 #ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', default='127.0.0.1, localhost').split(', ') # noqa
 
+# Воркер только для /api/: без админки, сессий, сообщений и статики.
+API_ONLY = (os.getenv('API_ONLY', 'False').lower() == 'true')
+
 INSTALLED_APPS = [
     'django.contrib.admin',
     'django.contrib.auth',
@@ -33,15 +36,32 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'api.middleware.RequestProfilerMiddleware',
+    'foodgram.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
+    'api.middleware.ChangeFeedInvalidationMiddleware',
+    'api.middleware.QueryInspectorMiddleware',
+    'foodgram.middleware.CsrfViewMiddleware',
+    'foodgram.middleware.AuthenticationMiddleware',
+    'foodgram.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+if API_ONLY:
+    INSTALLED_APPS = [
+        app for app in INSTALLED_APPS if app not in (
+            'django.contrib.admin',
+            'django.contrib.sessions',
+            'django.contrib.messages',
+            'django.contrib.staticfiles',
+        )
+    ]
+    MIDDLEWARE = [
+        entry for entry in MIDDLEWARE
+        if not entry.startswith('foodgram.middleware.')
+    ]
+
 ROOT_URLCONF = 'foodgram.urls'
 
 TEMPLATES = [
@@ -62,15 +82,27 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
 
+# Стандартные движки подменяются обёртками с проверкой и учётом
+# соединений (foodgram/db/lifecycle.py).
+DB_ENGINES = {
+    'django.db.backends.postgresql': 'foodgram.db.postgresql',
+    'django.db.backends.sqlite3': 'foodgram.db.sqlite3',
+}
+DB_ENGINE = os.getenv('ENGINE', default='django.db.backends.postgresql')
+
 DATABASES = {
     'default': {
-        'ENGINE': os.getenv('ENGINE',
-                            default='django.db.backends.postgresql'),
+        'ENGINE': DB_ENGINES.get(DB_ENGINE, DB_ENGINE),
         'NAME': os.getenv('DB_NAME'),
         'USER': os.getenv('POSTGRES_USER'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
-        'PORT': os.getenv('DB_PORT')
+        'PORT': os.getenv('DB_PORT'),
+        # Постоянные соединения: секунды жизни, 0 — на каждый запрос.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default='60')),
+        # Простаивавшее дольше соединение проверяется перед запросом.
+        'CONN_HEALTH_CHECK_INTERVAL': int(
+            os.getenv('DB_HEALTH_CHECK_INTERVAL', default='30')),
     }
 }
 
@@ -115,7 +147,33 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    },
+    'throttle': {
+        'BACKEND': os.getenv(
+            'THROTTLE_CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv(
+            'THROTTLE_CACHE_LOCATION', default='foodgram-throttle'),
+    },
+}
+
 REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.ORJSONRenderer',
+    ] + ([] if API_ONLY else [
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ]),
+    'DEFAULT_PARSER_CLASSES': [
+        'api.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
@@ -126,8 +184,75 @@ REST_FRAMEWORK = {
         'django_filters.rest_framework.DjangoFilterBackend',
     ],
     'SEARCH_PARAM': 'name',
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.UserTokenBucketThrottle',
+        'api.throttling.IPTokenBucketThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'user.read': '600/min',
+        'ip.read': '1200/min',
+        'user.write': '120/min',
+        'ip.write': '240/min',
+        'user.recipe_list': '300/min',
+        'ip.recipe_list': '600/min',
+        'user.recipe_write': '20/min',
+        'ip.recipe_write': '60/min',
+        'user.shopping_cart': '10/min',
+        'ip.shopping_cart': '30/min',
+        'user.upload': '30/min',
+        'ip.upload': '60/min',
+    },
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', default='1')),
 }
 
+# Выключает ограничения частоты и одновременных вызовов, например
+# для нагрузочного прогона replay_traffic с одного адреса.
+THROTTLING_ENABLED = (
+    os.getenv('THROTTLING_ENABLED', 'True').lower() == 'true')
+
+# Лимиты одновременных вызовов общие для всех воркеров, если кэш
+# 'throttle' общий; CONCURRENCY_TTL освобождает места упавших воркеров.
+CONCURRENCY_LIMITS = {
+    'recipe_write': 4,
+    'shopping_cart': 2,
+}
+CONCURRENCY_RETRY_AFTER = 5
+CONCURRENCY_TTL = 120
+
+# Схлопывание одинаковых вычислений: сколько ждать чужое вычисление,
+# на сколько держать блокировку в кэше и как часто её проверять (с).
+SINGLEFLIGHT_WAIT = 10
+SINGLEFLIGHT_LOCK_TIMEOUT = 30
+SINGLEFLIGHT_POLL = 0.05
+# Чем больше, тем раньше горячие ключи кэша обновляются заранее.
+CACHE_EARLY_REFRESH_BETA = float(
+    os.getenv('CACHE_EARLY_REFRESH_BETA', default='1.0'))
+
+# Сколько рецептов можно запросить разом через /api/recipes/?ids=.
+RECIPE_BATCH_LIMIT = int(os.getenv('RECIPE_BATCH_LIMIT', default='100'))
+
+# Прямая загрузка изображений: PUT по подписанному адресу принимает
+# nginx (auth_request + dav), UPLOAD_SERVE_LOCAL — Django без nginx.
+UPLOAD_URL = '/uploads/'
+UPLOAD_SLOT_TTL = 10 * 60
+UPLOAD_MAX_SIZE = 10 * 1024 * 1024
+UPLOAD_SERVE_LOCAL = (
+    os.getenv('UPLOAD_SERVE_LOCAL', str(DEBUG)).lower() == 'true')
+
+# Лента изменений: период опроса для сброса кэша (с).
+CHANGE_FEED_POLL = 1
+
+# Поиск N+1: лог повторяющихся запросов и превышения бюджетов.
+QUERY_INSPECTOR = (
+    os.getenv('QUERY_INSPECTOR', str(DEBUG)).lower() == 'true')
+QUERY_REPEAT_THRESHOLD = 3
+
+# Профилирование запросов по токену сотрудника.
+PROFILER_ROOT = os.getenv('PROFILER_ROOT', default=BASE_DIR / 'profiles')
+PROFILER_TOKEN_MAX_AGE = 60 * 60
+PROFILER_MAX_PROFILES = 200
+PROFILER_MAX_AGE_DAYS = 7
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
 }
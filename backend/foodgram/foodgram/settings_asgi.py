@@ -0,0 +1,11 @@
+"""Настройки для запуска под ASGI."""
+
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES
+
+# Под ASGI синхронный код выполняется в разных потоках, и постоянные
+# соединения не закрывались бы: здесь нужен внешний пул (PgBouncer).
+# Значение задаётся здесь, а не через окружение, чтобы DB_CONN_MAX_AGE
+# из общего .env его не переопределил.
+for database in DATABASES.values():
+    database['CONN_MAX_AGE'] = 0
@@ -1,7 +1,17 @@
-from django.contrib import admin
+from django.conf import settings
 from django.urls import include, path
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
 ]
+
+if settings.UPLOAD_SERVE_LOCAL:
+    from api.views import local_upload
+
+    urlpatterns.append(path(
+        f'{settings.UPLOAD_URL.lstrip("/")}<path:name>', local_upload))
+
+if not settings.API_ONLY:
+    from django.contrib import admin
+
+    urlpatterns.insert(0, path('admin/', admin.site.urls))
@@ -0,0 +1,29 @@
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', '1'))
+# Django, приложения и URLconf загружаются один раз в мастере,
+# воркеры получают их через fork без повторного импорта.
+preload_app = (os.getenv('GUNICORN_PRELOAD', 'True').lower() == 'true')
+
+
+def when_ready(server):
+    """С preload_app загрузить views и сериализаторы в мастере.
+
+    Воркеры получат их через fork. Без preload ничего не делается:
+    каждый воркер загрузит URLconf на первом запросе.
+    """
+    if server.cfg.preload_app:
+        from django.urls import get_resolver
+
+        get_resolver().url_patterns
+
+
+def pre_fork(server, worker):
+    """Соединения мастера не должны достаться воркерам по наследству."""
+    from django.core.cache import caches
+    from django.db import connections
+
+    connections.close_all()
+    for cache in caches.all():
+        cache.close()
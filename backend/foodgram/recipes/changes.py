@@ -0,0 +1,131 @@
+from django.db import transaction
+from django.db.models import F, Max, Min, Q
+
+from .models import Change, ChangeSequence
+
+PUBLIC_KINDS = ('recipe', 'tag', 'ingredient', 'author')
+FEED_LIMIT = 500
+PUBLISH_BATCH = 1000
+
+
+class CursorExpired(Exception):
+    """Курсор старше журнала: клиенту нужна полная перезагрузка."""
+
+
+def record(kind, action, object_id, user_id=None):
+    Change.objects.create(
+        kind=kind, action=action, object_id=object_id, user_id=user_id)
+    schedule_publish()
+
+
+def record_many(kind, action, object_ids):
+    """Общие изменения пачки объектов, записанных в обход сигналов."""
+    Change.objects.bulk_create([
+        Change(kind=kind, action=action, object_id=object_id)
+        for object_id in object_ids
+    ])
+    schedule_publish()
+
+
+def schedule_publish():
+    """Выдать номера записям после коммита текущей транзакции.
+
+    Флаг на соединении, как в schedule_rebuild: первый обработчик
+    on_commit публикует все записи, остальные ничего не делают.
+    """
+    connection = transaction.get_connection()
+    connection.changes_pending = True
+
+    def flush():
+        if connection.changes_pending:
+            connection.changes_pending = False
+            publish()
+    transaction.on_commit(flush)
+
+
+def last_id():
+    return Change.objects.aggregate(last=Max('id'))['last'] or 0
+
+
+def publish():
+    """Пронумеровать закоммиченные записи журнала без номера.
+
+    Id выдаются до коммита, и транзакция, начатая раньше, может
+    закоммититься позже, так что курсор по id пропускал бы её записи.
+    Номера выдаются уже после коммита под блокировкой строки счётчика:
+    нумерующие транзакции идут по очереди, и запись с меньшим номером
+    всегда видна раньше записи с большим. Записи транзакции, чей
+    процесс упал до on_commit, пронумерует следующий вызов.
+    """
+    with transaction.atomic():
+        counter = (
+            ChangeSequence.objects.select_for_update().filter(pk=1).first())
+        if counter is None:
+            # Записи, сделанные до появления seq, получают номер, равный
+            # id, поэтому уже выданные курсоры сохраняют смысл.
+            Change.objects.filter(seq__isnull=True).update(seq=F('id'))
+            ChangeSequence.objects.get_or_create(
+                pk=1, defaults={'last': last_id})
+            counter = ChangeSequence.objects.select_for_update().get(pk=1)
+        start = counter.last
+        pending = list(
+            Change.objects.filter(seq__isnull=True)
+            .order_by('id').only('id')[:PUBLISH_BATCH])
+        while pending:
+            for change in pending:
+                counter.last += 1
+                change.seq = counter.last
+            Change.objects.bulk_update(pending, ['seq'])
+            pending = list(
+                Change.objects.filter(seq__isnull=True)
+                .order_by('id').only('id')[:PUBLISH_BATCH])
+        if counter.last != start:
+            counter.save(update_fields=['last'])
+
+
+def published():
+    """Записи, которые уже получили номер и видны в ленте."""
+    return Change.objects.filter(seq__isnull=False)
+
+
+def latest_cursor():
+    return published().aggregate(cursor=Max('seq'))['cursor'] or 0
+
+
+def changes_since(since, user=None, limit=FEED_LIMIT):
+    """Сжатые изменения после курсора since, видимые пользователю.
+
+    Возвращает (changes, cursor, has_more); из нескольких записей
+    об одном объекте остаётся последняя.
+    """
+    oldest = published().aggregate(oldest=Min('seq'))['oldest']
+    if oldest is not None and since < oldest - 1:
+        raise CursorExpired
+    visible = Q(user_id__isnull=True)
+    if user is not None and user.is_authenticated:
+        visible |= Q(user_id=user.pk)
+    rows = list(
+        published().filter(visible, seq__gt=since)
+        .order_by('seq')
+        .values_list('seq', 'kind', 'action', 'object_id')[:limit + 1]
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    latest = {}
+    for seq, kind, action, object_id in rows:
+        latest.pop((kind, object_id), None)
+        latest[(kind, object_id)] = action
+    changes = [
+        {'kind': kind, 'id': object_id, 'action': action}
+        for (kind, object_id), action in latest.items()
+    ]
+    if rows:
+        cursor = rows[-1][0]
+    else:
+        cursor = max(since, latest_cursor())
+    return changes, cursor, has_more
+
+
+def prune(before):
+    """Удалить записи журнала старше before."""
+    return Change.objects.filter(created__lt=before).delete()[0]
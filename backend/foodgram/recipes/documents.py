@@ -0,0 +1,171 @@
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+
+from users.models import User
+from .models import Recipe, Recipe_is_ingredient, RecipeDocument
+
+TAG_VALUES = ('id', 'name', 'color', 'slug')
+INGREDIENT_VALUES = ('id', 'name', 'measurement_unit', 'amount')
+AUTHOR_VALUES = (
+    'email',
+    'id',
+    'username',
+    'first_name',
+    'last_name'
+)
+# Поля User, которые попадают в документы рецептов автора.
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+REBUILD_BATCH = 1000
+
+
+def image_url(name):
+    if not name:
+        return None
+    return Recipe._meta.get_field('image').storage.url(name)
+
+
+def fetch_tags(recipe_ids):
+    # Порядок тот же, что у recipe.tags.all(): Tag.Meta.ordering.
+    tags = defaultdict(list)
+    rows = (
+        Recipe.tags.through.objects
+        .filter(recipe_id__in=recipe_ids)
+        .order_by('tag_id')
+        .values_list('recipe_id', *(f'tag__{field}' for field in TAG_VALUES))
+    )
+    for recipe_id, *tag in rows:
+        tags[recipe_id].append(tag)
+    return tags
+
+
+def fetch_ingredients(recipe_ids):
+    # Порядок тот же, что у recipe.recipes.all(): по id связи.
+    ingredients = defaultdict(list)
+    rows = (
+        Recipe_is_ingredient.objects
+        .filter(recipe_id__in=recipe_ids)
+        .order_by('pk')
+        .values_list('recipe_id', 'ingredient__id', 'ingredient__name',
+                     'ingredient__measurement_unit', 'amount')
+    )
+    for recipe_id, *ingredient in rows:
+        ingredients[recipe_id].append(ingredient)
+    return ingredients
+
+
+def fetch_authors(author_ids):
+    return {
+        author[1]: list(author)
+        for author in User.objects.filter(
+            pk__in=author_ids).values_list(*AUTHOR_VALUES)
+    }
+
+
+def build_documents(recipe_ids):
+    """Документы рецептов: всё, кроме флагов текущего пользователя.
+
+    Вложенные объекты хранятся списками значений в порядке
+    TAG_VALUES, INGREDIENT_VALUES и AUTHOR_VALUES: jsonb не сохраняет
+    порядок ключей, а ответ API должен его сохранять. Ссылка на
+    изображение относительная, хост добавляет сериализатор.
+    """
+    rows = list(Recipe.objects.filter(pk__in=recipe_ids).values(
+        'id', 'author_id', 'name', 'image', 'text', 'cooking_time'))
+    if not rows:
+        return {}
+    ids = [row['id'] for row in rows]
+    tags = fetch_tags(ids)
+    ingredients = fetch_ingredients(ids)
+    authors = fetch_authors({row['author_id'] for row in rows})
+    return {
+        row['id']: {
+            'tags': tags[row['id']],
+            'author': authors[row['author_id']],
+            'ingredients': ingredients[row['id']],
+            'name': row['name'],
+            'image': image_url(row['image']),
+            'text': row['text'],
+            'cooking_time': row['cooking_time']
+        }
+        for row in rows
+    }
+
+
+def rebuild_documents(recipe_ids):
+    """Пересобрать и сохранить документы, заменив существующие."""
+    documents = build_documents(recipe_ids)
+    with transaction.atomic():
+        RecipeDocument.objects.filter(recipe_id__in=recipe_ids).delete()
+        RecipeDocument.objects.bulk_create([
+            RecipeDocument(recipe_id=pk, document=document)
+            for pk, document in documents.items()
+        ])
+    return documents
+
+
+def rebuild_in_batches(recipe_ids, size=REBUILD_BATCH):
+    """Пересобрать документы пачками по size, не держа все в памяти."""
+    batch = []
+    for recipe_id in recipe_ids:
+        batch.append(recipe_id)
+        if len(batch) == size:
+            rebuild_documents(batch)
+            batch = []
+    if batch:
+        rebuild_documents(batch)
+
+
+def drop_documents(recipes):
+    """Удалить документы рецептов выборки одним запросом.
+
+    Для тегов и ингредиентов, входящих в огромное число рецептов,
+    вместо пересборки в запросе: документы соберёт load_documents
+    при чтении или build_recipe_documents --missing.
+    """
+    RecipeDocument.objects.filter(recipe__in=recipes).delete()
+
+
+def load_documents(recipe_ids):
+    """Документы одним запросом; недостающие собираются и сохраняются.
+
+    Документ, собранный при чтении, не перезаписывает уже
+    сохранённый: свежую версию кладёт пересборка после коммита.
+    """
+    documents = dict(
+        RecipeDocument.objects.filter(recipe_id__in=recipe_ids)
+        .values_list('recipe_id', 'document')
+    )
+    missing = set(recipe_ids) - documents.keys()
+    if missing:
+        built = build_documents(missing)
+        try:
+            with transaction.atomic():
+                RecipeDocument.objects.bulk_create([
+                    RecipeDocument(recipe_id=pk, document=document)
+                    for pk, document in built.items()
+                ], ignore_conflicts=True)
+        except IntegrityError:
+            # Рецепт удалили между сборкой и сохранением.
+            pass
+        documents.update(built)
+    return documents
+
+
+def schedule_rebuild(recipe_ids):
+    """Пересобрать документы после коммита текущей транзакции.
+
+    Id копятся на соединении, и первый же обработчик on_commit
+    пересобирает их все, остальные находят пустой набор.
+    """
+    connection = transaction.get_connection()
+    pending = getattr(connection, 'recipe_documents', None)
+    if pending is None:
+        pending = connection.recipe_documents = set()
+    pending.update(recipe_ids)
+
+    def flush():
+        ids = sorted(pending)
+        pending.clear()
+        rebuild_in_batches(ids)
+    transaction.on_commit(flush)
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from recipes.documents import rebuild_in_batches
+from recipes.models import Recipe
+from tqdm import tqdm
+
+
+class Command(BaseCommand):
+    help = "Rebuild materialized recipe documents used by the recipe API"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--missing', action='store_true',
+                            help="only recipes without a document, e.g. "
+                                 "after a tag or ingredient was renamed")
+
+    def handle(self, *args, **options):
+        size = options['batch_size']
+        recipes = Recipe.objects.all()
+        if options['missing']:
+            recipes = recipes.filter(document__isnull=True)
+        recipe_ids = recipes.values_list('pk', flat=True).iterator(size)
+        rebuild_in_batches(
+            tqdm(recipe_ids, desc="Building documents", unit=" recipe"),
+            size)
+        self.stdout.write(
+            self.style.SUCCESS("Documents rebuilt successfully!"))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from recipes.models import Recipe
+from recipes.similarity import rebuild_signatures
+from tqdm import tqdm
+
+
+class Command(BaseCommand):
+    help = "Rebuild MinHash signatures and LSH buckets for recipes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        size = options['batch_size']
+        recipe_ids = Recipe.objects.values_list('pk', flat=True)
+        batch = []
+        for recipe_id in tqdm(recipe_ids.iterator(size),
+                              desc="Indexing recipes", unit=" recipe"):
+            batch.append(recipe_id)
+            if len(batch) == size:
+                rebuild_signatures(batch)
+                batch = []
+        if batch:
+            rebuild_signatures(batch)
+        self.stdout.write(self.style.SUCCESS("Index rebuilt successfully!"))
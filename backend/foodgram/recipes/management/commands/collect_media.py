@@ -0,0 +1,69 @@
+import os
+
+from django.core.management.base import BaseCommand
+from recipes.models import Recipe
+from recipes.storage import GRACE_PERIOD, UPLOAD_DIR, content_storage
+from tqdm import tqdm
+
+# Каталоги с изображениями рецептов и брошенными прямыми загрузками.
+MEDIA_DIRS = ('recipes', UPLOAD_DIR)
+
+
+def walk_files(root):
+    """Файлы каталога без построения полного списка в памяти."""
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry.path
+
+
+class Command(BaseCommand):
+    help = "Delete media files that are not referenced by any recipe"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true')
+        parser.add_argument('--grace', type=int, default=GRACE_PERIOD,
+                            help="keep files modified less than N s ago")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        roots = [
+            content_storage.path(directory) for directory in MEDIA_DIRS
+            if os.path.isdir(content_storage.path(directory))
+        ]
+        if not roots:
+            self.stdout.write("Nothing to collect.")
+            return
+        self.deleted = self.freed = 0
+        batch = []
+        paths = (path for root in roots for path in walk_files(root))
+        for path in tqdm(paths, desc="Scanning media", unit=" file"):
+            batch.append(
+                os.path.relpath(path, content_storage.location)
+                .replace(os.sep, '/'))
+            if len(batch) == options['batch_size']:
+                self.collect(batch, options)
+                batch = []
+        if batch:
+            self.collect(batch, options)
+        action = "Would delete" if options['dry_run'] else "Deleted"
+        self.stdout.write(self.style.SUCCESS(
+            f"{action} {self.deleted} files, {self.freed} bytes."))
+
+    def collect(self, names, options):
+        referenced = set(
+            Recipe.objects.filter(image__in=names)
+            .values_list('image', flat=True)
+        )
+        for name in names:
+            if name in referenced or not content_storage.is_stale(
+                    name, options['grace']):
+                continue
+            self.deleted += 1
+            self.freed += content_storage.size(name)
+            if not options['dry_run']:
+                content_storage.delete(name)
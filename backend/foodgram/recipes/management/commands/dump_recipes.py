@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from recipes.ndjson import DUMP_SPEC, close_stream, open_stream
+from tqdm import tqdm
+
+
+class Command(BaseCommand):
+    help = "Stream users, recipes and their relations to an NDJSON file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="output file, '-' for stdout")
+        parser.add_argument('--compress', action='store_true',
+                            help="gzip the output (implied by .gz)")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        encoder = DjangoJSONEncoder(ensure_ascii=False)
+        stream = open_stream(options['path'], 'w', options['compress'])
+        total = 0
+        try:
+            for label, model, fields, _ in DUMP_SPEC:
+                rows = (
+                    model.objects.order_by('pk')
+                    .values_list('pk', *fields)
+                    .iterator(options['chunk_size'])
+                )
+                for row in tqdm(rows, desc=f"Dumping {label}", unit=" row"):
+                    stream.write(encoder.encode({
+                        'model': label,
+                        'pk': row[0],
+                        'fields': dict(zip(fields, row[1:]))
+                    }))
+                    stream.write('\n')
+                    total += 1
+        finally:
+            close_stream(stream)
+        self.stderr.write(self.style.SUCCESS(f"Dumped {total} records."))
@@ -0,0 +1,381 @@
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.db.models import Q
+from PIL import Image, ImageOps
+from recipes.changes import record_many
+from recipes.documents import schedule_rebuild
+from recipes.models import (Change, Ingredient, Recipe, Recipe_is_ingredient,
+                            Tag, tags_mask)
+from recipes.ndjson import close_stream, open_stream
+from recipes.signals import recipes_bulk_created
+from recipes.similarity import build_index, recipe_features
+from recipes.storage import content_storage
+from tqdm import tqdm
+from users.models import User
+
+MAX_IMAGE_SIZE = 1200
+JPEG_QUALITY = 85
+SHOWN_ERRORS = 20
+
+
+def image_path(source, base):
+    """Локальный путь из пути или file:// ссылки.
+
+    Относительные пути считаются от каталога входного файла.
+    """
+    if not source:
+        raise ValueError("image is required")
+    if '://' in source:
+        url = urlparse(source)
+        if url.scheme != 'file':
+            raise ValueError(f"only local files are supported: {source}")
+        return url2pathname(url.path)
+    return os.path.join(base, source)
+
+
+def prepare_image(path, max_size):
+    """Декодировать и уменьшить изображение в процессе пула.
+
+    Возвращает (байты, расширение, None) или (None, None, ошибка).
+    """
+    try:
+        with Image.open(path) as image:
+            # JPEG декодируется сразу в уменьшенном масштабе.
+            image.draft('RGB', (max_size, max_size))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((max_size, max_size))
+            output = io.BytesIO()
+            if (image.mode in ('RGBA', 'LA')
+                    or 'transparency' in image.info):
+                image.convert('RGBA').save(output, 'PNG', optimize=True)
+                return output.getvalue(), '.png', None
+            image.convert('RGB').save(
+                output, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+            return output.getvalue(), '.jpg', None
+    except (OSError, ValueError, Image.DecompressionBombError) as error:
+        return None, None, f"{path}: {error}"
+
+
+def read_records(stream, path):
+    """Записи из JSON-массива (*.json) или построчного NDJSON."""
+    if path.endswith(('.json', '.json.gz')):
+        yield from json.load(stream)
+        return
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def checkpoint_path(path):
+    return f'{path}.checkpoint'
+
+
+def read_checkpoint(path):
+    try:
+        with open(checkpoint_path(path), encoding='utf-8') as file:
+            return json.load(file)['done']
+    except FileNotFoundError:
+        return 0
+
+
+def write_checkpoint(path, done):
+    """Атомарно записать число обработанных записей."""
+    temp = checkpoint_path(path) + '.tmp'
+    with open(temp, 'w', encoding='utf-8') as file:
+        json.dump({'done': done}, file)
+    os.replace(temp, checkpoint_path(path))
+
+
+def batches(records, size, start):
+    """Пачки (номер записи, запись) начиная с записи start."""
+    batch = []
+    for number, record in enumerate(islice(records, start, None), start):
+        batch.append((number, record))
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def start_workers(executor, count):
+    """Запустить все процессы пула сразу, пока соединения закрыты.
+
+    Пул создаёт процессы по мере отправки задач, а к первой пачке
+    соединение с базой уже снова открыто и досталось бы детям через
+    fork. Задачи спят, чтобы ни один процесс не освободился раньше,
+    чем пул создаст остальные.
+    """
+    list(executor.map(time.sleep, [0.1] * count))
+
+
+class InlineExecutor:
+    """Исполнитель без процессов для --workers 0."""
+
+    def map(self, func, *iterables):
+        return map(func, *iterables)
+
+    def shutdown(self):
+        pass
+
+
+class Command(BaseCommand):
+    help = ("Import recipes from a JSON array or NDJSON file. Each record "
+            "has name, text, cooking_time, image (path or file:// URL), "
+            "tags (slugs), ingredients ({name, measurement_unit, amount} "
+            "or {id, amount}) and author (email). Recipes already present "
+            "with the same author and name are skipped; an interrupted "
+            "import resumes from its checkpoint.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="input file, '-' for stdin")
+        parser.add_argument('--compress', action='store_true',
+                            help="input is gzipped (implied by .gz)")
+        parser.add_argument('--author',
+                            help="email of the author for records "
+                                 "without one")
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help="image processes, 0 to resize inline")
+        parser.add_argument('--max-image-size', type=int,
+                            default=MAX_IMAGE_SIZE,
+                            help="longest image side in pixels")
+        parser.add_argument('--restart', action='store_true',
+                            help="ignore the checkpoint and start over")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        resumable = path != '-'
+        if resumable and not os.path.exists(path):
+            raise CommandError(f"File not found: {path}")
+        start = 0
+        if resumable and not options['restart']:
+            start = read_checkpoint(path)
+            if start:
+                self.stdout.write(f"Resuming after {start} records.")
+        self.base = os.path.dirname(os.path.abspath(path))
+        self.max_size = options['max_image_size']
+        self.default_author = options['author']
+        self.tags = dict(Tag.objects.values_list('slug', 'id'))
+        self.ingredients = {
+            (name, unit): pk for pk, name, unit in
+            Ingredient.objects.values_list('pk', 'name', 'measurement_unit')
+        }
+        self.ingredient_ids = set(self.ingredients.values())
+        self.authors = {}
+        # (автор, название) рецептов, уже отправленных в пул.
+        self.seen = set()
+        self.errors = []
+        self.imported = self.existing = 0
+
+        # Дочерние процессы не должны унаследовать открытые соединения.
+        if options['workers'] > 0:
+            connections.close_all()
+            executor = ProcessPoolExecutor(options['workers'])
+            start_workers(executor, options['workers'])
+        else:
+            executor = InlineExecutor()
+        stream = open_stream(path, 'r', options['compress'])
+        started = time.perf_counter()
+        try:
+            records = batches(
+                read_records(stream, path), options['batch_size'], start)
+            progress = tqdm(desc="Importing", unit=" recipe", initial=start)
+            pending = None
+            for batch in records:
+                # Изображения следующей пачки готовятся, пока
+                # текущая пишется в базу.
+                ready, pending = pending, self.submit(executor, batch)
+                if ready is not None:
+                    done = self.write(*ready)
+                    progress.update(len(ready[0]))
+                    if resumable:
+                        write_checkpoint(path, done)
+            if pending is not None:
+                self.write(*pending)
+                progress.update(len(pending[0]))
+            progress.close()
+        finally:
+            executor.shutdown()
+            close_stream(stream)
+        if resumable and os.path.exists(checkpoint_path(path)):
+            os.remove(checkpoint_path(path))
+
+        spent = time.perf_counter() - started
+        for error in self.errors[:SHOWN_ERRORS]:
+            self.stderr.write(error)
+        if len(self.errors) > SHOWN_ERRORS:
+            self.stderr.write(
+                f"... and {len(self.errors) - SHOWN_ERRORS} more errors")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {self.imported} recipes in {spent:.1f}s "
+            f"({self.imported / spent if spent else 0:.1f} recipes/s), "
+            f"{self.existing} already present, "
+            f"{len(self.errors)} skipped."))
+        self.stdout.write(
+            "Run update_recipe_scores to rank the imported recipes.")
+
+    def submit(self, executor, batch):
+        """Проверить записи пачки и отдать их изображения в пул.
+
+        Рецепты, которые уже есть в базе, отсеиваются до обработки
+        изображений, поэтому повторный запуск почти ничего не стоит.
+        """
+        self.load_authors(batch)
+        resolved = []
+        for number, record in batch:
+            try:
+                path = image_path(record.get('image'), self.base)
+            except ValueError as error:
+                self.errors.append(f"record {number}: {error}")
+                continue
+            row = self.resolve(number, record)
+            if row is not None:
+                resolved.append((number, path, row))
+        fresh = []
+        for item in self.exclude_existing(resolved):
+            key = (item[2][0]['author_id'], item[2][0]['name'])
+            if key in self.seen:
+                self.existing += 1
+                continue
+            self.seen.add(key)
+            fresh.append(item)
+        images = executor.map(
+            prepare_image,
+            [path for _, path, _ in fresh],
+            [self.max_size] * len(fresh)
+        )
+        return batch, fresh, images
+
+    def exclude_existing(self, resolved):
+        if not resolved:
+            return []
+        lookup = Q()
+        for _, _, (fields, _, _) in resolved:
+            lookup |= Q(author_id=fields['author_id'], name=fields['name'])
+        existing = set(
+            Recipe.objects.filter(lookup).values_list('author_id', 'name'))
+        fresh = []
+        for item in resolved:
+            fields = item[2][0]
+            if (fields['author_id'], fields['name']) in existing:
+                self.existing += 1
+            else:
+                fresh.append(item)
+        return fresh
+
+    def load_authors(self, batch):
+        emails = {
+            record.get('author') or self.default_author
+            for _, record in batch
+        } - self.authors.keys() - {None}
+        self.authors.update(
+            User.objects.filter(email__in=emails).values_list('email', 'id'))
+
+    def resolve(self, number, record):
+        """Поля рецепта, id тегов и ингредиенты или None с ошибкой."""
+        def fail(message):
+            self.errors.append(f"record {number}: {message}")
+
+        author = record.get('author') or self.default_author
+        if author not in self.authors:
+            return fail(f"unknown author {author!r}")
+        try:
+            cooking_time = int(record.get('cooking_time'))
+        except (TypeError, ValueError):
+            return fail("cooking_time must be an integer")
+        if cooking_time < 1 or not record.get('name') or not (
+                record.get('text')):
+            return fail("name, text and cooking_time >= 1 are required")
+        tag_ids = []
+        for slug in record.get('tags') or ():
+            if slug not in self.tags:
+                return fail(f"unknown tag {slug!r}")
+            tag_ids.append(self.tags[slug])
+        ingredients = {}
+        for item in record.get('ingredients') or ():
+            pk = item.get('id')
+            if pk is None:
+                pk = self.ingredients.get(
+                    (item.get('name'), item.get('measurement_unit')))
+            if pk not in self.ingredient_ids:
+                return fail(f"unknown ingredient {item!r}")
+            if pk in ingredients:
+                return fail(f"duplicate ingredient {item!r}")
+            try:
+                ingredients[pk] = int(item.get('amount'))
+            except (TypeError, ValueError):
+                return fail(f"amount must be an integer in {item!r}")
+            if ingredients[pk] < 1:
+                return fail(f"amount must be >= 1 in {item!r}")
+        if not tag_ids or not ingredients:
+            return fail("at least one tag and one ingredient are required")
+        fields = {
+            'author_id': self.authors[author],
+            'name': record['name'],
+            'text': record['text'],
+            'cooking_time': cooking_time,
+        }
+        return fields, list(dict.fromkeys(tag_ids)), ingredients
+
+    def write(self, batch, fresh, images):
+        """Записать пачку одной транзакцией, вернуть номер следующей записи."""
+        rows = []
+        for (number, _, (fields, tag_ids, ingredients)), (
+                data, extension, error) in zip(fresh, images):
+            if error is not None:
+                self.errors.append(f"record {number}: {error}")
+                continue
+            image = content_storage.save(
+                f'recipes/import{extension}', ContentFile(data))
+            rows.append((
+                Recipe(image=image, tags_mask=tags_mask(tag_ids), **fields),
+                tag_ids, ingredients
+            ))
+        if rows:
+            self.insert(rows)
+        self.imported += len(rows)
+        return batch[-1][0] + 1
+
+    @transaction.atomic
+    def insert(self, rows):
+        recipes = [recipe for recipe, _, _ in rows]
+        if connection.features.can_return_rows_from_bulk_insert:
+            Recipe.objects.bulk_create(recipes)
+            record_many('recipe', Change.UPSERT,
+                        [recipe.pk for recipe in recipes])
+        else:
+            # Без RETURNING bulk_create не отдаёт id; save() при
+            # этом сам пишет журнал изменений через сигналы.
+            for recipe in recipes:
+                recipe.save(force_insert=True)
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag_id)
+            for recipe, tag_ids, _ in rows
+            for tag_id in tag_ids
+        ])
+        Recipe_is_ingredient.objects.bulk_create([
+            Recipe_is_ingredient(
+                recipe_id=recipe.pk, ingredient_id=pk, amount=amount)
+            for recipe, _, ingredients in rows
+            for pk, amount in ingredients.items()
+        ])
+        build_index({
+            recipe.pk: recipe_features(ingredients, tag_ids)
+            for recipe, tag_ids, ingredients in rows
+        })
+        recipe_ids = [recipe.pk for recipe in recipes]
+        schedule_rebuild(recipe_ids)
+        # bulk_create не шлёт сигналов, сбрасывающих кэш ответов.
+        transaction.on_commit(lambda: recipes_bulk_created.send(
+            sender=Recipe, recipe_ids=recipe_ids))
@@ -4,7 +4,7 @@ import os
 
 from django.core.management.base import BaseCommand
 from foodgram import settings
-from recipes.models import Ingredient
+from recipes.models import Ingredient, normalize_name
 from tqdm import tqdm
 
 logger = logging.getLogger(__name__)
@@ -22,7 +22,8 @@ class Command(BaseCommand):
                 next(reader)
 
                 ingredients = [
-                    Ingredient(name=row[0], measurement_unit=row[1])
+                    Ingredient(name=row[0], measurement_unit=row[1],
+                               search_name=normalize_name(row[0]))
                     for row in tqdm(reader,
                                     desc="Loading ingredients",
                                     unit=" row")
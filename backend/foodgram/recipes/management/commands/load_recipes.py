@@ -0,0 +1,133 @@
+import json
+from itertools import groupby
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from recipes.models import (Ingredient, Recipe, Recipe_is_ingredient,
+                            normalize_name)
+from recipes.ndjson import DUMP_SPEC, NATURAL_KEYS, close_stream, open_stream
+from recipes.similarity import schedule_signatures
+from tqdm import tqdm
+
+SPEC = {label: (model, fields, foreign_keys)
+        for label, model, fields, foreign_keys in DUMP_SPEC}
+# Модели, на которые ссылаются другие записи дампа: для них
+# запоминается соответствие старых и новых первичных ключей.
+REFERENCED = {
+    target
+    for _, _, _, foreign_keys in DUMP_SPEC
+    for target in foreign_keys.values()
+}
+
+
+def batches(records, size):
+    """Пачки подряд идущих записей одной модели."""
+    for label, group in groupby(records, key=lambda record: record['model']):
+        batch = []
+        for record in group:
+            batch.append(record)
+            if len(batch) == size:
+                yield label, batch
+                batch = []
+        if batch:
+            yield label, batch
+
+
+class Command(BaseCommand):
+    help = "Restore an NDJSON dump made by dump_recipes with id remapping"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="input file, '-' for stdin")
+        parser.add_argument('--compress', action='store_true',
+                            help="input is gzipped (implied by .gz)")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        self.id_map = {label: {} for label in REFERENCED}
+        self.skipped = 0
+        created = 0
+        stream = open_stream(options['path'], 'r', options['compress'])
+        try:
+            records = (
+                json.loads(line)
+                for line in tqdm(stream, desc="Restoring", unit=" row")
+                if line.strip()
+            )
+            for label, batch in batches(records, options['batch_size']):
+                if label not in SPEC:
+                    raise CommandError(f"Unknown model in dump: {label}")
+                # Модели идут в порядке DUMP_SPEC, ссылки переводятся на
+                # уже загруженные записи, поэтому каждая пачка
+                # коммитится отдельно.
+                with transaction.atomic():
+                    created += self.restore(label, batch)
+        finally:
+            close_stream(stream)
+        self.stdout.write(self.style.SUCCESS(
+            f"Restored {created} records, skipped {self.skipped}."))
+        self.stdout.write(
+            "Run rebuild_tag_masks, build_recipe_documents and "
+            "update_recipe_scores --full "
+            "to rebuild derived data.")
+
+    def remap(self, label, batch):
+        model, fields, foreign_keys = SPEC[label]
+        rows = []
+        for record in batch:
+            values = dict(record['fields'])
+            for field, target in foreign_keys.items():
+                values[field] = self.id_map[target].get(values[field])
+            if None in (values[field] for field in foreign_keys):
+                self.skipped += 1
+                continue
+            rows.append((record['pk'], values))
+        return rows
+
+    def match_existing(self, label, rows):
+        """Сопоставить записи с существующими по естественному ключу."""
+        model = SPEC[label][0]
+        keys = NATURAL_KEYS[label]
+        lookup = Q()
+        for _, values in rows:
+            lookup |= Q(**{key: values[key] for key in keys})
+        existing = {
+            tuple(row[1:]): row[0]
+            for row in model.objects.filter(lookup).values_list('pk', *keys)
+        }
+        fresh = []
+        for old_pk, values in rows:
+            pk = existing.get(tuple(values[key] for key in keys))
+            if pk is None:
+                fresh.append((old_pk, values))
+            else:
+                self.id_map[label][old_pk] = pk
+        return fresh
+
+    def restore(self, label, batch):
+        model = SPEC[label][0]
+        rows = self.remap(label, batch)
+        if label in NATURAL_KEYS and rows:
+            rows = self.match_existing(label, rows)
+        objects = [model(**values) for _, values in rows]
+        if model is Ingredient:
+            for obj in objects:
+                obj.search_name = normalize_name(obj.name)
+        if label not in REFERENCED:
+            model.objects.bulk_create(objects, ignore_conflicts=True)
+            if model is Recipe_is_ingredient:
+                schedule_signatures({obj.recipe_id for obj in objects})
+            return len(objects)
+        if connection.features.can_return_rows_from_bulk_insert:
+            model.objects.bulk_create(objects)
+        else:
+            for obj in objects:
+                obj.save(force_insert=True)
+        for (old_pk, _), obj in zip(rows, objects):
+            self.id_map[label][old_pk] = obj.pk
+        if model is Recipe and objects:
+            # auto_now_add перезаписывает дату публикации при вставке.
+            for (_, values), obj in zip(rows, objects):
+                obj.pub_date = values['pub_date']
+            Recipe.objects.bulk_update(objects, ['pub_date'])
+        return len(objects)
@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from recipes.changes import prune
+
+
+class Command(BaseCommand):
+    help = "Delete change feed entries older than the retention period"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30,
+                            help="keep entries from the last N days")
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options['days'])
+        deleted = prune(before)
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {deleted} change feed entries."))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from recipes.models import Recipe
+from recipes.signals import refresh_tags_mask
+from tqdm import tqdm
+
+
+class Command(BaseCommand):
+    help = "Recalculate Recipe.tags_mask from the recipe tags"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        size = options['batch_size']
+        batch = []
+        recipe_ids = Recipe.objects.values_list('pk', flat=True)
+        for recipe_id in tqdm(recipe_ids.iterator(size),
+                              desc="Rebuilding tag masks", unit=" recipe"):
+            batch.append(recipe_id)
+            if len(batch) == size:
+                refresh_tags_mask(batch)
+                batch = []
+        if batch:
+            refresh_tags_mask(batch)
+        self.stdout.write(self.style.SUCCESS("Tag masks rebuilt!"))
@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from recipes.models import Recipe, ScoreRun
+from recipes.scores import (HALF_LIFE_HOURS, SETTLE, apply_new_activity,
+                            dirty_recipe_ids, rebuild_scores)
+from tqdm import tqdm
+
+SCORE_FIELDS = ('popularity', 'trending', 'score_updated')
+
+
+def chunks(queryset, size):
+    batch = []
+    for recipe in queryset.only('pk', *SCORE_FIELDS).iterator(size):
+        batch.append(recipe)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Command(BaseCommand):
+    help = "Recalculate popular and trending recipe scores"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help="recalculate every recipe instead of changed ones")
+        parser.add_argument(
+            '--half-life', type=float, default=HALF_LIFE_HOURS,
+            help="trending half-life in hours (changing it needs --full)")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        until = timezone.now() - SETTLE
+        half_life = options['half_life']
+        size = options['batch_size']
+        last_run = ScoreRun.objects.filter(pk=1).first()
+
+        if options['full'] or last_run is None:
+            stale = Recipe.objects.all()
+            fresh = Recipe.objects.none()
+        else:
+            stale = Recipe.objects.filter(score_updated__isnull=True)
+            fresh = Recipe.objects.filter(
+                pk__in=dirty_recipe_ids(last_run.until, until),
+                score_updated__lt=until
+            )
+
+        updated = 0
+        progress = tqdm(desc="Updating scores", unit=" recipe")
+        for batch in chunks(stale, size):
+            with transaction.atomic():
+                Recipe.objects.bulk_update(
+                    rebuild_scores(batch, until, half_life), SCORE_FIELDS)
+            updated += len(batch)
+            progress.update(len(batch))
+        for batch in chunks(fresh, size):
+            with transaction.atomic():
+                Recipe.objects.bulk_update(
+                    apply_new_activity(batch, until, half_life),
+                    SCORE_FIELDS)
+            updated += len(batch)
+            progress.update(len(batch))
+        progress.close()
+        ScoreRun.objects.update_or_create(pk=1, defaults={'until': until})
+        self.stdout.write(self.style.SUCCESS(
+            f"Updated scores for {updated} recipes."))
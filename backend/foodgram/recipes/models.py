@@ -1,9 +1,21 @@
 from django.core.exceptions import ValidationError
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
 from django.core.validators import MinValueValidator, RegexValidator
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _  # noqa
 from users.models import User
 
+from .storage import content_storage
+
+
+# Теги с id до MASK_TAG_LIMIT дублируются битами в Recipe.tags_mask:
+# бит 63 знаковый, поэтому используются только младшие 63 бита.
+MASK_TAG_LIMIT = 63
+# GIN-индекс с pg_trgm для поиска ингредиентов с опечатками.
+TRIGRAM_SEARCH = 'postgresql' in settings.DATABASES['default']['ENGINE']
+
 
 class Recipe(models.Model):
     """Модель рецепт."""
@@ -22,6 +34,8 @@ class Recipe(models.Model):
     image = models.ImageField(
         'Изображение',
         upload_to='recipes/',
+        storage=content_storage,
+        db_index=True,
         blank=False
     )
     pub_date = models.DateTimeField(
@@ -44,6 +58,23 @@ class Recipe(models.Model):
         'Tag',
         verbose_name='Теги'
     )
+    tags_mask = models.BigIntegerField(
+        'Маска тегов',
+        default=0
+    )
+    popularity = models.IntegerField(
+        'Популярность',
+        default=0
+    )
+    trending = models.FloatField(
+        'Рейтинг в трендах',
+        default=0
+    )
+    score_updated = models.DateTimeField(
+        'Рейтинг пересчитан',
+        null=True,
+        blank=True
+    )
 
     def formatted_pub_date(self):
         return self.pub_date.strftime('%Y-%m-%d %H:%M')
@@ -52,11 +83,46 @@ class Recipe(models.Model):
         ordering = ['-pub_date']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=['-pub_date', 'tags_mask'],
+                name='recipe_pub_date_tags_idx'
+            ),
+            models.Index(
+                fields=['-popularity', '-pub_date'],
+                name='recipe_popular_idx'
+            ),
+            models.Index(
+                fields=['-trending', '-pub_date'],
+                name='recipe_trending_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.name} (опубликовано {self.formatted_pub_date()})'
 
 
+def tag_bit(tag_id):
+    """Бит тега в Recipe.tags_mask, None для тегов без своего бита."""
+    if 1 <= tag_id <= MASK_TAG_LIMIT:
+        return 1 << (tag_id - 1)
+    return None
+
+
+def tags_mask(tag_ids):
+    mask = 0
+    for tag_id in tag_ids:
+        bit = tag_bit(tag_id)
+        if bit is not None:
+            mask |= bit
+    return mask
+
+
+def normalize_name(text):
+    """Нижний регистр, ё -> е и одиночные пробелы между словами."""
+    return ' '.join(text.lower().replace('ё', 'е').split())
+
+
 class Ingredient(models.Model):
     """Модель ингредиенты."""
 
@@ -68,12 +134,29 @@ class Ingredient(models.Model):
         'Единица измерения',
         max_length=200
     )
+    search_name = models.CharField(
+        'Название для поиска',
+        max_length=200,
+        default='',
+        editable=False
+    )
 
     class Meta:
         ordering = ['name']
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
         unique_together = ('name', 'measurement_unit')
+        indexes = [
+            GinIndex(
+                fields=['search_name'],
+                name='ingredient_search_trgm_idx',
+                opclasses=['gin_trgm_ops']
+            ),
+        ] if TRIGRAM_SEARCH else []
+
+    def save(self, *args, **kwargs):
+        self.search_name = normalize_name(self.name)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}'
@@ -119,6 +202,7 @@ class Tag(models.Model):
                 )
 
     class Meta:
+        ordering = ['id']
         verbose_name = 'Тег'
         verbose_name_plural = 'Теги'
 
@@ -147,6 +231,7 @@ class Recipe_is_ingredient(models.Model):
     )
 
     class Meta:
+        ordering = ['id']
         verbose_name = 'Ингредиенты в рецепте'
         verbose_name_plural = 'Ингредиенты в рецептах'
         constraints = [
@@ -178,6 +263,11 @@ class Favorite(models.Model):
         related_name='favorite_recipe',
         verbose_name='Избранный рецепт'
     )
+    created = models.DateTimeField(
+        'Дата добавления',
+        default=timezone.now,
+        db_index=True
+    )
 
     class Meta:
         verbose_name = 'Избранное'
@@ -208,6 +298,11 @@ class Shopping_cart(models.Model):
         related_name='shopping_recipe',
         verbose_name='Рецепт в корзине'
     )
+    created = models.DateTimeField(
+        'Дата добавления',
+        default=timezone.now,
+        db_index=True
+    )
 
     class Meta:
         verbose_name = 'Корзина'
@@ -221,3 +316,195 @@ class Shopping_cart(models.Model):
 
     def __str__(self):
         return f'{self.user.username} - {self.recipe.name}'
+
+
+class ScoreRun(models.Model):
+    """Граница событий, уже учтённых в рейтингах рецептов.
+
+    Хранится одной строкой и сдвигается только после успешного
+    пересчёта.
+    """
+
+    until = models.DateTimeField(
+        'События учтены до'
+    )
+
+    class Meta:
+        verbose_name = 'Пересчёт рейтингов'
+        verbose_name_plural = 'Пересчёты рейтингов'
+
+    def __str__(self):
+        return f'Рейтинги до {self.until:%Y-%m-%d %H:%M:%S}'
+
+
+class RecipeSignature(models.Model):
+    """MinHash-подпись набора ингредиентов и тегов рецепта."""
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='signature',
+        verbose_name='Рецепт'
+    )
+    minhash = models.JSONField(
+        'MinHash-подпись'
+    )
+
+    class Meta:
+        verbose_name = 'Подпись рецепта'
+        verbose_name_plural = 'Подписи рецептов'
+
+    def __str__(self):
+        return f'Подпись рецепта {self.recipe_id}'
+
+
+class RecipeBucket(models.Model):
+    """Корзина LSH-индекса для поиска похожих рецептов."""
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='buckets',
+        verbose_name='Рецепт'
+    )
+    band = models.PositiveSmallIntegerField(
+        'Полоса'
+    )
+    bucket = models.BigIntegerField(
+        'Хеш полосы'
+    )
+
+    class Meta:
+        verbose_name = 'Корзина LSH'
+        verbose_name_plural = 'Корзины LSH'
+        indexes = [
+            models.Index(
+                fields=['band', 'bucket', 'recipe'],
+                name='recipe_bucket_idx'
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'band'],
+                name='unique_recipe_band'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id}: {self.band}/{self.bucket}'
+
+
+class RecipeDocument(models.Model):
+    """Готовое представление рецепта без полей текущего пользователя."""
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='document',
+        verbose_name='Рецепт'
+    )
+    document = models.JSONField(
+        'Документ'
+    )
+    built = models.DateTimeField(
+        'Дата сборки',
+        auto_now=True
+    )
+
+    class Meta:
+        verbose_name = 'Документ рецепта'
+        verbose_name_plural = 'Документы рецептов'
+
+    def __str__(self):
+        return f'Документ рецепта {self.recipe_id}'
+
+
+class Change(models.Model):
+    """Запись журнала изменений для инкрементальной синхронизации.
+
+    Пишется в той же транзакции, что и само изменение. Курсором ленты
+    /api/changes/ служит seq: номер выдаётся после коммита (см.
+    recipes.changes.publish), до этого запись в ленту не попадает.
+    """
+
+    UPSERT = 'upsert'
+    DELETE = 'delete'
+    ACTIONS = (
+        (UPSERT, 'Создание или изменение'),
+        (DELETE, 'Удаление'),
+    )
+    KINDS = (
+        ('recipe', 'Рецепт'),
+        ('tag', 'Тег'),
+        ('ingredient', 'Ингредиент'),
+        ('author', 'Автор'),
+        ('favorite', 'Избранное'),
+        ('shopping_cart', 'Корзина'),
+        ('subscribe', 'Подписка'),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    seq = models.BigIntegerField(
+        'Номер в ленте',
+        null=True,
+        blank=True,
+        unique=True
+    )
+    kind = models.CharField(
+        'Тип объекта',
+        max_length=16,
+        choices=KINDS
+    )
+    action = models.CharField(
+        'Действие',
+        max_length=8,
+        choices=ACTIONS
+    )
+    object_id = models.BigIntegerField(
+        'Объект'
+    )
+    user_id = models.BigIntegerField(
+        'Владелец личного события',
+        null=True,
+        blank=True
+    )
+    created = models.DateTimeField(
+        'Дата изменения',
+        default=timezone.now,
+        db_index=True
+    )
+
+    class Meta:
+        ordering = ['id']
+        verbose_name = 'Изменение'
+        verbose_name_plural = 'Журнал изменений'
+        indexes = [
+            models.Index(
+                fields=['user_id', 'seq'],
+                name='change_user_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.id}: {self.kind} {self.object_id} {self.action}'
+
+
+class ChangeSequence(models.Model):
+    """Последний выданный номер ленты изменений.
+
+    Строка блокируется на время выдачи номеров, так что номера
+    видны читателям строго по возрастанию.
+    """
+
+    last = models.BigIntegerField(
+        'Последний номер'
+    )
+
+    class Meta:
+        verbose_name = 'Счётчик ленты изменений'
+        verbose_name_plural = 'Счётчик ленты изменений'
+
+    def __str__(self):
+        return f'Лента изменений: {self.last}'
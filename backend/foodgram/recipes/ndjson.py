@@ -0,0 +1,69 @@
+import gzip
+import sys
+
+from recipes.models import (Favorite, Ingredient, Recipe, Recipe_is_ingredient,
+                            Shopping_cart, Tag)
+from users.models import Subscribe, User
+
+# (метка, модель, поля, внешние ключи {поле: метка модели}), в порядке
+# зависимостей: при восстановлении ссылки всегда указывают на уже
+# загруженные записи.
+DUMP_SPEC = (
+    ('users.user', User, (
+        'email', 'username', 'first_name', 'last_name', 'password',
+        'is_active', 'is_staff', 'is_superuser', 'date_joined', 'last_login'
+    ), {}),
+    ('recipes.tag', Tag, ('name', 'color', 'slug'), {}),
+    ('recipes.ingredient', Ingredient, ('name', 'measurement_unit'), {}),
+    ('recipes.recipe', Recipe, (
+        'author_id', 'name', 'text', 'cooking_time', 'image', 'pub_date'
+    ), {'author_id': 'users.user'}),
+    ('recipes.recipe_tags', Recipe.tags.through, ('recipe_id', 'tag_id'), {
+        'recipe_id': 'recipes.recipe', 'tag_id': 'recipes.tag'
+    }),
+    ('recipes.recipe_is_ingredient', Recipe_is_ingredient, (
+        'recipe_id', 'ingredient_id', 'amount'
+    ), {
+        'recipe_id': 'recipes.recipe', 'ingredient_id': 'recipes.ingredient'
+    }),
+    ('recipes.favorite', Favorite, ('user_id', 'recipe_id', 'created'), {
+        'user_id': 'users.user', 'recipe_id': 'recipes.recipe'
+    }),
+    ('recipes.shopping_cart', Shopping_cart, (
+        'user_id', 'recipe_id', 'created'
+    ), {
+        'user_id': 'users.user', 'recipe_id': 'recipes.recipe'
+    }),
+    ('users.subscribe', Subscribe, ('user_id', 'author_id'), {
+        'user_id': 'users.user', 'author_id': 'users.user'
+    }),
+)
+
+# Записи этих моделей сопоставляются с уже существующими по
+# естественному ключу вместо создания дубликатов.
+NATURAL_KEYS = {
+    'users.user': ('email',),
+    'recipes.tag': ('slug',),
+    'recipes.ingredient': ('name', 'measurement_unit'),
+}
+
+
+def is_compressed(path, compress=False):
+    return compress or path.endswith('.gz')
+
+
+def open_stream(path, mode, compress=False):
+    """Текстовый поток файла дампа, '-' означает stdin/stdout."""
+    if path == '-':
+        if not compress:
+            return sys.stdout if 'w' in mode else sys.stdin
+        raw = sys.stdout.buffer if 'w' in mode else sys.stdin.buffer
+        return gzip.open(raw, mode + 't', encoding='utf-8')
+    if is_compressed(path, compress):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def close_stream(stream):
+    if stream not in (sys.stdout, sys.stdin):
+        stream.close()
@@ -0,0 +1,99 @@
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from .models import Favorite, Shopping_cart
+
+SCORE_EPOCH = datetime(2023, 1, 1, tzinfo=timezone.utc)
+HALF_LIFE_HOURS = 72
+# События моложе этого ждут следующего пересчёта: транзакция,
+# создавшая событие, могла ещё не завершиться.
+SETTLE = timedelta(minutes=1)
+ACTIVITY_WEIGHTS = (
+    (Favorite, 1.0),
+    (Shopping_cart, 0.5),
+)
+
+
+def activity_exponent(created, half_life=HALF_LIFE_HOURS):
+    """Логарифм (по основанию 2) вклада события в рейтинг трендов.
+
+    Вклад считается относительно фиксированной эпохи, поэтому
+    затухание со временем не меняет порядок рецептов и хранимый
+    рейтинг не нужно пересчитывать, пока нет новых событий.
+    """
+    hours = (created - SCORE_EPOCH).total_seconds() / 3600
+    return hours / half_life
+
+
+def log2_sum(exponents, initial=None):
+    """log2(2 ** initial + сумма 2 ** x) без переполнения."""
+    exponents = list(exponents)
+    if initial is not None:
+        exponents.append(initial)
+    if not exponents:
+        return 0.0
+    top = max(exponents)
+    return top + math.log2(sum(2 ** (x - top) for x in exponents))
+
+
+def collect_activity(recipe_ids, until, since=None,
+                     half_life=HALF_LIFE_HOURS):
+    """Количество событий из [since, until) и экспоненты их вкладов."""
+    counts = defaultdict(int)
+    exponents = defaultdict(list)
+    for model, weight in ACTIVITY_WEIGHTS:
+        events = model.objects.filter(
+            recipe_id__in=recipe_ids, created__lt=until)
+        if since is not None:
+            events = events.filter(created__gte=since)
+        for recipe_id, created in events.values_list(
+                'recipe_id', 'created').iterator():
+            counts[recipe_id] += 1
+            exponents[recipe_id].append(
+                math.log2(weight) + activity_exponent(created, half_life))
+    return counts, exponents
+
+
+def dirty_recipe_ids(since, until):
+    """Рецепты с событиями из [since, until)."""
+    ids = set()
+    for model, weight in ACTIVITY_WEIGHTS:
+        ids.update(
+            model.objects.filter(created__gte=since, created__lt=until)
+            .values_list('recipe_id', flat=True).distinct()
+        )
+    return ids
+
+
+def rebuild_scores(recipes, until, half_life=HALF_LIFE_HOURS):
+    """Полный пересчёт рейтингов по событиям до until."""
+    recipe_ids = [recipe.pk for recipe in recipes]
+    counts, exponents = collect_activity(
+        recipe_ids, until, half_life=half_life)
+    for recipe in recipes:
+        recipe.popularity = counts[recipe.pk]
+        recipe.trending = log2_sum(exponents[recipe.pk])
+        recipe.score_updated = until
+    return recipes
+
+
+def apply_new_activity(recipes, until, half_life=HALF_LIFE_HOURS):
+    """Добавить к рейтингам события, ещё не учтённые у рецепта.
+
+    score_updated рецепта — граница уже учтённых событий, поэтому
+    повтор прерванного пересчёта не считает события дважды.
+    """
+    by_since = defaultdict(list)
+    for recipe in recipes:
+        by_since[recipe.score_updated].append(recipe)
+    for since, group in by_since.items():
+        counts, exponents = collect_activity(
+            [recipe.pk for recipe in group], until, since, half_life)
+        for recipe in group:
+            if counts[recipe.pk]:
+                previous = recipe.trending if recipe.popularity else None
+                recipe.popularity += counts[recipe.pk]
+                recipe.trending = log2_sum(exponents[recipe.pk], previous)
+            recipe.score_updated = until
+    return recipes
@@ -0,0 +1,149 @@
+import threading
+from collections import defaultdict
+
+from django.db import connection, models
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.lookups import PostgresOperatorLookup
+
+from .models import Ingredient, normalize_name
+
+# Порог доли совпавших триграмм слова запроса, как word_similarity
+# в pg_trgm (pg_trgm.word_similarity_threshold по умолчанию 0.6).
+FUZZY_THRESHOLD = 0.6
+# Короче этого нечёткий поиск бессмысленен: остаётся поиск по префиксу.
+FUZZY_MIN_LENGTH = 3
+# Сколько нечётких совпадений берётся из индекса в памяти.
+FUZZY_LIMIT = 50
+PREFIX, WORD_PREFIX, FUZZY = range(3)
+
+
+def trigrams(word):
+    """Триграммы слова с теми же отступами, что и в pg_trgm."""
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramWordSimilar(PostgresOperatorLookup):
+    lookup_name = 'trigram_word_similar'
+    postgres_operator = '%%>'
+
+
+class TrigramWordSimilarity(models.Func):
+    function = 'WORD_SIMILARITY'
+    output_field = models.FloatField()
+
+
+models.CharField.register_lookup(TrigramWordSimilar)
+
+
+class NgramIndex:
+    """Триграммный индекс названий ингредиентов в памяти процесса.
+
+    Замена pg_trgm для SQLite: строится один раз и перестраивается,
+    когда меняется число ингредиентов или наибольший id.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.key = None
+        self.postings = {}
+
+    def refresh(self):
+        key = tuple(Ingredient.objects.aggregate(
+            count=models.Count('id'), last=models.Max('id')).values())
+        if key == self.key:
+            return
+        with self.lock:
+            if key == self.key:
+                return
+            postings = defaultdict(list)
+            for pk, name in Ingredient.objects.values_list(
+                    'id', 'search_name').iterator():
+                for gram in set().union(*map(trigrams, name.split())):
+                    postings[gram].append(pk)
+            self.postings, self.key = postings, key
+
+    def clear(self):
+        self.key = None
+
+    def similar(self, words):
+        """{id: сумма сходства по словам}, если нашлись все слова."""
+        self.refresh()
+        scores = None
+        for word in words:
+            grams = trigrams(word)
+            shared = defaultdict(int)
+            for gram in grams:
+                for pk in self.postings.get(gram, ()):
+                    shared[pk] += 1
+            matched = {
+                pk: count / len(grams) for pk, count in shared.items()
+                if count / len(grams) >= FUZZY_THRESHOLD
+            }
+            if scores is None:
+                scores = matched
+            else:
+                scores = {
+                    pk: score + matched[pk]
+                    for pk, score in scores.items() if pk in matched
+                }
+        return scores or {}
+
+
+ngram_index = NgramIndex()
+
+
+def trigram_match(words):
+    """Условие и сходство через pg_trgm: каждое слово запроса найдено."""
+    match = Q()
+    similarity = Value(0.0)
+    for word in words:
+        match &= Q(search_name__trigram_word_similar=word)
+        similarity = similarity + TrigramWordSimilarity(
+            Value(word), F('search_name'))
+    return match, similarity
+
+
+def ngram_match(words):
+    scores = sorted(
+        ngram_index.similar(words).items(),
+        key=lambda item: -item[1]
+    )[:FUZZY_LIMIT]
+    if not scores:
+        return Q(pk__in=[]), Value(0.0)
+    return Q(pk__in=[pk for pk, _ in scores]), Case(
+        *[When(pk=pk, then=Value(score)) for pk, score in scores],
+        default=Value(0.0),
+        output_field=models.FloatField()
+    )
+
+
+def search_ingredients(queryset, query):
+    """Ингредиенты по запросу: префикс, начало слова, затем опечатки.
+
+    На PostgreSQL опечатки ищутся через pg_trgm и GIN-индекс, на
+    остальных базах - через триграммный индекс в памяти.
+    """
+    query = normalize_name(query)
+    if not query:
+        return queryset
+    prefix = Q(search_name__startswith=query)
+    word_prefix = Q(search_name__contains=f' {query}')
+    if len(query) < FUZZY_MIN_LENGTH:
+        fuzzy, similarity = Q(pk__in=[]), Value(0.0)
+    elif connection.vendor == 'postgresql':
+        fuzzy, similarity = trigram_match(query.split())
+    else:
+        fuzzy, similarity = ngram_match(query.split())
+    return queryset.filter(prefix | word_prefix | fuzzy).alias(
+        rank=Case(
+            When(prefix, then=Value(PREFIX)),
+            When(word_prefix, then=Value(WORD_PREFIX)),
+            default=Value(FUZZY),
+        ),
+        similarity=Case(
+            When(prefix | word_prefix, then=Value(0.0)),
+            default=similarity,
+            output_field=models.FloatField()
+        ),
+    ).order_by('rank', '-similarity', 'name')
@@ -0,0 +1,288 @@
+from django.db import connections, transaction
+from django.db.models import F
+from django.db.models.signals import (m2m_changed, post_delete, post_migrate,
+                                      post_save, pre_delete, pre_migrate,
+                                      pre_save)
+from django.dispatch import Signal, receiver
+
+from users.models import Subscribe, User
+from .changes import record
+from .documents import AUTHOR_FIELDS, drop_documents, schedule_rebuild
+from .models import (TRIGRAM_SEARCH, Change, Favorite, Ingredient, Recipe,
+                     Recipe_is_ingredient, Shopping_cart, Tag, normalize_name,
+                     tag_bit, tags_mask)
+from .search import ngram_index
+from .similarity import schedule_signatures
+from .storage import content_storage
+
+# Рецепты добавлены через bulk_create, без сигналов моделей; шлётся
+# после коммита с аргументом recipe_ids.
+recipes_bulk_created = Signal()
+
+
+def release_image(name):
+    """Удалить файл изображения, если на него больше нет ссылок.
+
+    Недавно загруженные файлы остаются до запуска collect_media.
+    """
+    if not name:
+        return
+
+    def delete_if_orphaned():
+        if (not Recipe.objects.filter(image=name).exists()
+                and content_storage.is_stale(name)):
+            content_storage.delete(name)
+    transaction.on_commit(delete_if_orphaned)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=Shopping_cart)
+def activity_deleted(sender, instance, **kwargs):
+    """Удаление события требует полного пересчёта рейтинга рецепта."""
+    Recipe.objects.filter(pk=instance.recipe_id).update(score_updated=None)
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_image(sender, instance, **kwargs):
+    instance.previous_image = None
+    if instance.pk:
+        instance.previous_image = (
+            Recipe.objects.filter(pk=instance.pk)
+            .values_list('image', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def image_replaced(sender, instance, **kwargs):
+    previous = getattr(instance, 'previous_image', None)
+    if previous and previous != instance.image.name:
+        release_image(previous)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    release_image(instance.image.name)
+
+
+def refresh_tags_mask(recipe_ids):
+    masks = {pk: [] for pk in recipe_ids}
+    for recipe_id, tag_id in Recipe.tags.through.objects.filter(
+            recipe_id__in=recipe_ids).values_list('recipe_id', 'tag_id'):
+        masks[recipe_id].append(tag_id)
+    for recipe_id, tag_ids in masks.items():
+        Recipe.objects.filter(pk=recipe_id).update(
+            tags_mask=tags_mask(tag_ids))
+    return {pk: tags_mask(tag_ids) for pk, tag_ids in masks.items()}
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Поддерживать Recipe.tags_mask в соответствии с тегами."""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        instance.tags_mask = refresh_tags_mask([instance.pk])[instance.pk]
+    elif action == 'post_clear':
+        clear_tag_bit(instance, Recipe.objects.all())
+    else:
+        refresh_tags_mask(pk_set)
+
+
+def clear_tag_bit(tag, recipes):
+    bit = tag_bit(tag.pk)
+    if bit is not None:
+        recipes.update(tags_mask=F('tags_mask').bitand(~bit))
+
+
+@receiver(pre_delete, sender=Tag)
+def tag_deleted(sender, instance, **kwargs):
+    clear_tag_bit(instance, Recipe.objects.filter(tags=instance))
+
+
+# Модель -> (тип в журнале, поле объекта, поле владельца личного события).
+CHANGE_SOURCES = {
+    Recipe: ('recipe', 'pk', None),
+    Tag: ('tag', 'pk', None),
+    Ingredient: ('ingredient', 'pk', None),
+    Favorite: ('favorite', 'recipe_id', 'user_id'),
+    Shopping_cart: ('shopping_cart', 'recipe_id', 'user_id'),
+    Subscribe: ('subscribe', 'author_id', 'user_id'),
+}
+
+
+def record_change(sender, instance, action):
+    kind, object_field, user_field = CHANGE_SOURCES[sender]
+    record(
+        kind,
+        action,
+        getattr(instance, object_field),
+        getattr(instance, user_field) if user_field else None
+    )
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=Shopping_cart)
+@receiver(post_save, sender=Subscribe)
+def object_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        record_change(sender, instance, Change.UPSERT)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=Shopping_cart)
+@receiver(post_delete, sender=Subscribe)
+def object_deleted(sender, instance, **kwargs):
+    record_change(sender, instance, Change.DELETE)
+
+
+@receiver(pre_migrate)
+def create_trigram_extension(sender, using, **kwargs):
+    """Индекс поиска ингредиентов требует расширения pg_trgm."""
+    if sender.label == 'recipes' and TRIGRAM_SEARCH:
+        with connections[using].cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+
+@receiver(post_migrate)
+def fill_search_names(sender, using, **kwargs):
+    """Заполнить search_name у ингредиентов, созданных до его появления."""
+    if sender.label != 'recipes':
+        return
+    ingredients = list(
+        Ingredient.objects.using(using).filter(search_name='')
+        .only('id', 'name')
+    )
+    for ingredient in ingredients:
+        ingredient.search_name = normalize_name(ingredient.name)
+    Ingredient.objects.using(using).bulk_update(
+        ingredients, ['search_name'], batch_size=500)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    ngram_index.clear()
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_document_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_rebuild([instance.pk])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_document_tags_changed(sender, instance, action, reverse, pk_set,
+                                 **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear', 'post_clear'):
+        return
+    if not reverse:
+        if action != 'pre_clear':
+            schedule_rebuild([instance.pk])
+    elif action == 'pre_clear':
+        # После очистки уже не узнать, у каких рецептов был тег.
+        schedule_rebuild(
+            Recipe.objects.filter(tags=instance).values_list('pk', flat=True))
+    elif action != 'post_clear':
+        schedule_rebuild(pk_set)
+
+
+@receiver((post_save, post_delete), sender=Recipe_is_ingredient)
+def recipe_document_ingredients_changed(sender, instance, raw=False,
+                                        **kwargs):
+    if not raw:
+        schedule_rebuild([instance.recipe_id])
+
+
+@receiver((post_save, post_delete), sender=Recipe_is_ingredient)
+def recipe_signature_changed(sender, instance, raw=False, **kwargs):
+    """Подпись MinHash строится по ингредиентам рецепта."""
+    if not raw:
+        schedule_signatures([instance.recipe_id])
+
+
+# Поля тегов и ингредиентов, которые попадают в документы рецептов.
+REFERENCE_FIELDS = {
+    Tag: ('name', 'color', 'slug'),
+    Ingredient: ('name', 'measurement_unit'),
+}
+
+
+@receiver(pre_save, sender=Tag)
+@receiver(pre_save, sender=Ingredient)
+def remember_reference_fields(sender, instance, **kwargs):
+    instance.previous_fields = None
+    if instance.pk:
+        instance.previous_fields = (
+            sender.objects.filter(pk=instance.pk)
+            .values_list(*REFERENCE_FIELDS[sender]).first()
+        )
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def recipe_document_reference_changed(sender, instance, raw=False,
+                                      **kwargs):
+    """Тег или ингредиент входит в документы всех рецептов с ним.
+
+    Таких рецептов может быть сколько угодно, поэтому их документы
+    удаляются одним запросом и собираются заново при чтении.
+    """
+    if raw or kwargs.get('created'):
+        return
+    if kwargs['signal'] is post_save and instance.previous_fields == tuple(
+            getattr(instance, field) for field in REFERENCE_FIELDS[sender]):
+        return
+    if sender is Ingredient:
+        recipes = Recipe.objects.filter(recipes__ingredient=instance)
+    else:
+        recipes = Recipe.objects.filter(tags=instance)
+    drop_documents(recipes)
+
+
+@receiver(pre_save, sender=User)
+def remember_author_fields(sender, instance, raw=False, update_fields=None,
+                           **kwargs):
+    """Отметить сохранение, которое меняет автора в его рецептах.
+
+    Вход в систему, смена пароля и активация сохраняют пользователя,
+    не меняя полей автора, а у большинства пользователей рецептов нет.
+    """
+    instance.author_fields_changed = False
+    if raw or not instance.pk:
+        return
+    fields = AUTHOR_FIELDS
+    if update_fields is not None:
+        fields = AUTHOR_FIELDS & set(update_fields)
+    if not fields:
+        return
+    fields = sorted(fields)
+    previous = (
+        User.objects.filter(pk=instance.pk).values_list(*fields).first()
+    )
+    instance.author_fields_changed = (
+        previous is not None
+        and previous != tuple(getattr(instance, field) for field in fields)
+        and Recipe.objects.filter(author=instance).exists()
+    )
+
+
+@receiver(post_save, sender=User)
+def author_saved(sender, instance, **kwargs):
+    """Имя автора входит в его рецепты в ответах других воркеров."""
+    if getattr(instance, 'author_fields_changed', False):
+        record('author', Change.UPSERT, instance.pk)
+
+
+@receiver(post_save, sender=User)
+def recipe_document_author_changed(sender, instance, **kwargs):
+    """Пересобрать рецепты автора, только если изменился его профиль."""
+    if getattr(instance, 'author_fields_changed', False):
+        schedule_rebuild(
+            Recipe.objects.filter(author=instance)
+            .values_list('pk', flat=True))
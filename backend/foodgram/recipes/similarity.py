@@ -0,0 +1,181 @@
+import hashlib
+import random
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .models import Recipe, Recipe_is_ingredient, RecipeBucket, RecipeSignature
+
+BANDS = 24
+ROWS = 3
+NUM_PERM = BANDS * ROWS
+MAX_CANDIDATES = 200
+# Сколько рецептов берётся из одной корзины. Корзины частых сочетаний
+# (соль, масло) содержат заметную долю каталога, а так запрос читает
+# не больше BANDS * BUCKET_LIMIT строк индекса.
+BUCKET_LIMIT = 100
+PRIME = (1 << 61) - 1
+
+_random = random.Random(20230101)
+PERMUTATIONS = [
+    (_random.randrange(1, PRIME), _random.randrange(0, PRIME))
+    for _ in range(NUM_PERM)
+]
+
+
+def stable_hash(value, bits=64):
+    digest = hashlib.blake2b(
+        value.encode('utf-8'), digest_size=bits // 8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def recipe_features(ingredient_ids, tag_ids):
+    """Множество признаков рецепта: ингредиенты и теги."""
+    return (
+        {f'i{pk}' for pk in ingredient_ids}
+        | {f't{pk}' for pk in tag_ids}
+    )
+
+
+def minhash(features):
+    """MinHash-подпись по ингредиентам.
+
+    Теги встречаются у огромной доли рецептов и дают гигантские
+    корзины, поэтому в подпись не входят и учитываются только
+    при точном ранжировании.
+    """
+    hashes = [
+        stable_hash(feature) for feature in features
+        if feature.startswith('i')
+    ]
+    if not hashes:
+        return []
+    return [
+        min((a * value + b) % PRIME for value in hashes)
+        for a, b in PERMUTATIONS
+    ]
+
+
+def band_buckets(signature):
+    """Хеши полос подписи, укладываются в знаковый BigIntegerField."""
+    if not signature:
+        return []
+    return [
+        (band, stable_hash(
+            ','.join(map(str, signature[band * ROWS:(band + 1) * ROWS])),
+            bits=64
+        ) - (1 << 63))
+        for band in range(BANDS)
+    ]
+
+
+def jaccard(first, second):
+    if not first and not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+def feature_sets(recipe_ids):
+    """Признаки рецептов, собранные двумя запросами."""
+    features = defaultdict(set)
+    for recipe_id, ingredient_id in (
+        Recipe_is_ingredient.objects
+        .filter(recipe_id__in=recipe_ids)
+        .values_list('recipe_id', 'ingredient_id')
+    ):
+        features[recipe_id].add(f'i{ingredient_id}')
+    for recipe_id, tag_id in (
+        Recipe.tags.through.objects
+        .filter(recipe_id__in=recipe_ids)
+        .values_list('recipe_id', 'tag_id')
+    ):
+        features[recipe_id].add(f't{tag_id}')
+    return features
+
+
+def build_index(recipe_features_map):
+    """Подписи и корзины для рецептов {id: множество признаков}."""
+    signatures = []
+    buckets = []
+    for recipe_id, features in recipe_features_map.items():
+        signature = minhash(features)
+        signatures.append(
+            RecipeSignature(recipe_id=recipe_id, minhash=signature))
+        buckets.extend(
+            RecipeBucket(recipe_id=recipe_id, band=band, bucket=bucket)
+            for band, bucket in band_buckets(signature)
+        )
+    recipe_ids = list(recipe_features_map)
+    with transaction.atomic():
+        RecipeSignature.objects.filter(recipe_id__in=recipe_ids).delete()
+        RecipeBucket.objects.filter(recipe_id__in=recipe_ids).delete()
+        RecipeSignature.objects.bulk_create(signatures)
+        RecipeBucket.objects.bulk_create(buckets)
+
+
+def rebuild_signatures(recipe_ids):
+    """Пересобрать подписи рецептов.
+
+    Рецепт без ингредиентов получает пустую подпись, удалённые
+    рецепты пропускаются.
+    """
+    existing = Recipe.objects.filter(
+        pk__in=recipe_ids).values_list('pk', flat=True)
+    features = feature_sets(recipe_ids)
+    build_index({pk: features[pk] for pk in existing})
+
+
+def schedule_signatures(recipe_ids):
+    """Пересобрать подписи после коммита текущей транзакции.
+
+    Как schedule_rebuild для документов: id копятся на соединении,
+    первый обработчик on_commit пересобирает их все.
+    """
+    connection = transaction.get_connection()
+    pending = getattr(connection, 'recipe_signatures', None)
+    if pending is None:
+        pending = connection.recipe_signatures = set()
+    pending.update(recipe_ids)
+
+    def flush():
+        ids = sorted(pending)
+        pending.clear()
+        if ids:
+            rebuild_signatures(ids)
+    transaction.on_commit(flush)
+
+
+def similar_recipe_ids(recipe, limit):
+    """Похожие рецепты: кандидаты из LSH, точное ранжирование по Жаккару."""
+    buckets = list(
+        RecipeBucket.objects.filter(recipe=recipe)
+        .values_list('band', 'bucket')
+    )
+    if not buckets:
+        return []
+    limited = reduce(or_, (
+        Q(pk__in=RecipeBucket.objects
+          .filter(band=band, bucket=bucket)
+          .order_by('-recipe_id')
+          .values('pk')[:BUCKET_LIMIT])
+        for band, bucket in buckets
+    ))
+    candidates = list(
+        RecipeBucket.objects
+        .filter(limited)
+        .exclude(recipe=recipe)
+        .values('recipe_id')
+        .annotate(hits=Count('pk'))
+        .order_by('-hits', '-recipe_id')
+        .values_list('recipe_id', flat=True)[:MAX_CANDIDATES]
+    )
+    features = feature_sets([recipe.pk, *candidates])
+    own = features[recipe.pk]
+    ranked = sorted(
+        candidates,
+        key=lambda pk: (-jaccard(own, features[pk]), -pk)
+    )
+    return ranked[:limit]
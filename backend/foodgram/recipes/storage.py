@@ -0,0 +1,56 @@
+import hashlib
+import os
+import time
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+# Файлы моложе этого срока (в секундах) не удаляются: их может
+# прямо сейчас переиспользовать параллельная загрузка того же файла.
+GRACE_PERIOD = 60 * 60
+# Каталог объектов, загруженных клиентами напрямую по слотам.
+UPLOAD_DIR = 'uploads'
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, именующее файлы по SHA-256 их содержимого.
+
+    Одинаковые файлы хранятся один раз, повторная загрузка тех же
+    байт не перезаписывает файл, а только обновляет его mtime.
+    """
+
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(
+            os.path.dirname(name), digest[:2], digest[2:4],
+            digest + extension
+        )
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        if self.exists(name):
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length)
+
+    def is_stale(self, name, grace=GRACE_PERIOD):
+        try:
+            modified = os.path.getmtime(self.path(name))
+        except FileNotFoundError:
+            return False
+        return time.time() - modified > grace
+
+
+content_storage = ContentAddressedStorage()
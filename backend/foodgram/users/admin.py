@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from recipes.paginators import EstimatedCountPaginator
 from .models import Subscribe, User
 
 
@@ -7,8 +8,9 @@ from .models import Subscribe, User
 class UserAdmin(admin.ModelAdmin):
     list_display = ('username', 'pk', 'email', 'first_name', 'last_name')
     list_editable = ('email', 'first_name', 'last_name')
-    list_filter = ('username', 'email')
     search_fields = ('username', 'email')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     empty_value_display = None
 
 
@@ -16,4 +18,8 @@ class UserAdmin(admin.ModelAdmin):
 class SubscribeAdmin(admin.ModelAdmin):
     list_display = ('pk', 'user', 'author')
     list_editable = ('user', 'author')
+    list_select_related = ('user', 'author')
+    raw_id_fields = ('user', 'author')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     empty_value_display = None